@@ -1,25 +1,59 @@
 #event times are logged with reference to SPACE key press, not window popup
 #pause function is just an emergency measure, not supposed to be used by participants
 
-from psychopy import visual, core, event, gui, parallel
-import pandas as pd
-import csv
+# Only what is needed up to the participant dialog is imported at the top; psychopy.visual and
+# the stimulus modules follow once an ID has been entered (see the startup breakdown printed
+# before the first trial)
+from startup import StartupTimer
+startup = StartupTimer()
+
+import sys
+if '--dry-run' in sys.argv:
+    # Headless run with simulated window, keyboard, clock and port (see dryrun.py)
+    import dryrun
+    dryrun.install(sys.argv[1:])
+
+from psychopy import core, gui, logging
 import os
 import traceback
-from datetime import timedelta, datetime
-
-# Set the parallel port address
-parallel.setPortAddress(0x3FE8)  # Replace with your actual parallel port address
-# Clear any previous settings or data on the parallel port
-parallel.setData(0)
+import journal
+from journal import (EventJournal, completed_trials, completed_trials_csv, next_segment, read_trial_list,
+                     segment_postfix)
+from checkpoint import Checkpoint, file_hash, load_checkpoint
+from plan import FIXED_TRIGGERS, load_plan
+from eventstore import EventStore, write_csv_logs, write_session_info
+from timing import TimingRecorder, write_timing_logs
+from clocksync import ClockSync
+from realtime import RealtimeMode
+from monitor import MonitorStream
+from timeline import Timeline, minutes
+from triggers import TriggerDispatcher
+import trigger_ports
+import calibration
+from calibration import SCHEDULE
+startup.mark('imports')
+
+# Trigger port: the parallel port at 0x3FE8 unless this station has a trigger_config.json
+# (serial/USB TTL box, socket, ...; see trigger_ports.py)
+port = trigger_ports.open_port(trigger_ports.load_config({'backend': 'parallel', 'address': 0x3FE8}))
+# Clear any previous settings or data on the port
+port.write(0)
+# Write latency and jitter of this port, saved with the session info
+trigger_latency = trigger_ports.calibrate(port)
+print(trigger_ports.latency_line(trigger_latency))
 
 #Basic Code to send a trigger
 # Send trigger value, e.g., 5
-parallel.setData(255)
+port.write(255)
 # Short pulse duration using core.wait
 core.wait(0.01)  # Adjust the delay if needed
-# Reset the parallel port (clear the trigger)
-parallel.setData(0)
+# Reset the port (clear the trigger)
+port.write(0)
+startup.mark('trigger port')
+
+# From here on codes are armed with triggers.arm(), written on the next flip and cleared
+# on a later one after at least 10ms
+triggers = TriggerDispatcher(port.write, core.getTime, pulse_width=0.01)
 
 # ---------- Get Participant Info ----------
 # Create a dialog box to get participant ID; exit if cancelled
@@ -27,17 +61,120 @@ participant_info = {'Participant ID': ''}
 dlg = gui.DlgFromDict(dictionary=participant_info, title='Participant Info')
 if not dlg.OK:
     core.quit()
+startup.mark('participant dialog', waiting=True)
 
 # Use participant ID to name the data files
 participant_id = participant_info['Participant ID']
+journal_filename = f"{participant_id}_journal.bin"
+checkpoint_filename = f"{participant_id}_checkpoint.json"
 data_filename = f"{participant_id}_data.csv"
 word_log_filename = f"{participant_id}_word_log.csv"
+trigger_log_filename = f"{participant_id}_trigger_log.csv"
+timing_filename = f"{participant_id}_timing.csv"
+timing_summary_filename = f"{participant_id}_timing_summary.csv"
+flip_times_filename = f"{participant_id}_flip_times.bin"
+session_info_filename = f"{participant_id}_session_info.json"
 
 # ---------- Load Stimuli ----------
-stimuli_df = pd.read_csv('randomized_list_1.csv')
+stimuli_path = 'randomized_list_1.csv'
+list_hash = file_hash(stimuli_path)
+
+# ---------- Resume Logic ----------
+# Initialize resume mechanism
+resume_trial = 0
+interrupted_word = -1
+postfix = ''
+completed = 0
+
+# If a previous session exists, check how far it got and offer to resume (in case of previous crash).
+# The checkpoint says where it stopped; the journal, then the _data.csv, are the fallbacks for
+# sessions recorded before checkpoints (or journals) were written.
+last_checkpoint = load_checkpoint(checkpoint_filename)
+if last_checkpoint is not None and last_checkpoint['list_sha256'] != list_hash:
+    # Resuming with a different list would mix up the trials; stop before anything is overwritten
+    dlg_mismatch = gui.Dlg(title="Cannot resume")
+    dlg_mismatch.addText(f"{stimuli_path} has changed since the last session of {participant_id}.")
+    dlg_mismatch.show()
+    core.quit()
+
+try:
+    if last_checkpoint is not None:
+        completed = last_checkpoint['trial']
+        interrupted_word = last_checkpoint['word']
+    elif os.path.exists(journal_filename):
+        completed = completed_trials(journal_filename)
+    elif os.path.exists(data_filename):
+        completed = completed_trials_csv(data_filename)
+    if completed:
+        resume_trial = completed
+        dlg_resume = gui.Dlg(title="Επανεκκίνηση;")
+        if interrupted_word >= 0:
+            dlg_resume.addText(f"Trial {resume_trial + 1} interrupted at word {interrupted_word + 1}.")
+        dlg_resume.addText(f"Να συνεχίσει από το trial {resume_trial + 1};")
+        dlg_resume.addField("Επανεκκίνηση;", choices=["Yes", "No"])
+        resume = dlg_resume.show()
+        if dlg_resume.OK and resume[0] == "Yes":
+            postfix = segment_postfix(next_segment(journal_filename, data_filename))
+        else:
+            resume_trial = 0
+            interrupted_word = -1
+except Exception:
+    # If any error happens here, ignore and proceed from beginning
+    resume_trial = 0
+    interrupted_word = -1
+if not completed and os.path.exists(data_filename):
+    # Earlier data whose trials could not be counted: start over, but never overwrite it
+    postfix = segment_postfix(next_segment(journal_filename, data_filename))
+    logging.warning(f"{data_filename} has no completed trials. Logging to {postfix} files.")
+startup.mark('resume check + dialog', waiting=bool(completed))
 
 # ---------- Create Window ----------
+from psychopy import visual
+from keyinput import KeyInput
+from presenter import RSVPPresenter
+from stimulus_pool import StimulusPool
+from word_textures import WordTextures
+startup.mark('psychopy.visual import')
+
 win = visual.Window(fullscr=False, color='white', units='pix')
+kb = KeyInput()  # Timestamped key presses; response times count from the question onset
+startup.mark('window')
+
+# ---------- Timing Preflight ----------
+# Refresh rate and stability, flip latency, draw cost and trigger write latency of this station,
+# measured once and cached per machine and screen (see calibration.py)
+profile = calibration.preflight(win, trigger_latency)
+print(calibration.profile_line(profile))
+startup.mark('timing preflight')
+
+# ---------- Frame Timing ----------
+# The durations of calibration.SCHEDULE (250ms blank, 1s fixation, 100ms blank, 450ms words
+# with 100ms gaps) in refresh frames at the measured frame rate
+presenter = RSVPPresenter(win, frame_rate=profile['frame_rate'], triggers=triggers)
+frames = {name: presenter.frames(seconds) for name, seconds in SCHEDULE.items()}
+# Refuse a station that cannot run this schedule, unless the experimenter runs it anyway
+problems, timing_warnings = calibration.check(profile, frames, pulse_width=triggers.pulse_width)
+for warning in timing_warnings:
+    logging.warning(f'Timing: {warning}')
+if problems and not calibration.confirm(problems):
+    win.close()
+    core.quit()
+# Records intended vs actual word onsets/offsets, dropped frames and trigger delays
+timing = TimingRecorder(presenter.frame_duration, frames['word'], triggers)
+presenter.timing = timing
+startup.mark('frame rate')
+
+# ---------- Compile Trial Plan ----------
+# Words, trigger codes (sentence onset 1, word 100, question 254) and 4 blocks of equal numbers
+# of trials, compiled once from the list and cached next to it; the trial loop only indexes
+# into the plan. BLOCK_BY = 'time' cuts the blocks at equal expected durations instead
+BLOCK_BY = 'trials'
+plan = load_plan(stimuli_path, frames, FIXED_TRIGGERS, num_blocks=4, list_hash=list_hash, block_by=BLOCK_BY)
+total_trials = len(plan)
+# Expected session length, and time left estimated from the trials run so far (see timeline.py)
+timeline = Timeline(plan, presenter.frame_duration)
+print(timeline.report(resume_trial))
+startup.mark('trial plan')
 
 # ---------- Show Instructions ----------
 instruction_text = (
@@ -51,239 +188,182 @@ instruction = visual.TextStim(win, text=instruction_text, color='black', height=
 instruction.draw()
 win.flip()
 
+# Fixation, pause, question and break screens, built once for the session. Words are shown as
+# pre-rendered textures: those of the plan are loaded now (rendered once and kept on disk)
+stims = StimulusPool(win, textures=WordTextures(win, height=40, color='black'))
+startup.mark('instructions + stimuli')
+stims.textures.preload(plan.words)
+startup.mark('word textures')
+print(stims.textures.report())
+print(startup.report())
+
 # Wait for SPACE key and record time when pressed
 start_press_time = core.getTime()
-event.waitKeys(keyList=['space'])
-start_time_str = str(timedelta(seconds=core.getTime() - start_press_time))
-
-# ---------- Resume Logic ----------
-# Initialize logs and resume mechanism
-trial_data = []
-word_log = []
-resume_trial = 0
-postfix = ''
-
-# If previous data exists, check how far it got and offer to resume (in case of previous crash)
-try:
-    if os.path.exists(data_filename):
-        with open(data_filename, 'r', encoding='utf-8') as f:
-            reader = csv.reader(f)
-            lines = list(reader)
-            header_idx = next(i for i, l in enumerate(lines) if 'trial_num' in l)
-            completed = [int(row[0]) for row in lines[header_idx + 1:] if row[0].isdigit()]
-            if completed:
-                resume_trial = max(completed)
-                dlg_resume = gui.Dlg(title="Επανεκκίνηση;")
-                dlg_resume.addText(f"Να συνεχίσει από το trial {resume_trial + 1};")
-                dlg_resume.addField("Επανεκκίνηση;", choices=["Yes", "No"])
-                resume = dlg_resume.show()
-                if dlg_resume.OK and resume[0] == "Yes": # Mark resume point in logs
-                    rt = core.getTime()
-                    postfix = '_postcrash'
-                    trial_data.append({'trial_num': '', 'sentence_id': 'RESUME_DETECTED', 'sentence': '',
-                                       'question': '', 'correct_answer': '', 'response': '',
-                                       'event_time': str(timedelta(seconds=rt)),
-                                       'real_time': datetime.now().strftime('%H:%M:%S.%f')[:-3]})
-                    word_log.append({'trial_num': '', 'sentence_id': 'RESUME_DETECTED', 'word': '',
-                                     'event_time': str(timedelta(seconds=rt)),
-                                     'real_time': datetime.now().strftime('%H:%M:%S.%f')[:-3]})
-
-                else:
-                    resume_trial = 0
-except:
-    # If any error happens here, ignore and proceed from beginning
-    pass
+kb.wait(['space'])
+first_space = core.getTime() - start_press_time
 
 # ---------- Start Timing ----------
 # Record the start time of the main experiment
 experiment_start = core.getTime()
 
-# ---------- Block Setup ----------
-# Split total trials into equal-sized blocks
-total_trials = len(stimuli_df)
-num_blocks = 4
-block_size = total_trials // num_blocks
+# ---------- Open Event Journal ----------
+# Every event goes through events.add(): it is kept in compact in-memory columns and written
+# to the journal by a background thread. The CSV logs are written from the event store at the
+# end (or later from the journal with journal.py after a hard crash).
+# If the experiment resumed after a crash, '_postcrash' suffix is added to the filenames
+# ('_postcrash2', ... after later crashes). Resumed data is saved in separate files and never
+# overwrites the original or an earlier resumed segment.
+events = EventStore(EventJournal(journal_filename.replace('.bin', f'{postfix}.bin')))
+
+# ---------- Clock Alignment ----------
+# Paired PsychoPy/wall-clock samples go into the journal once a second, the first before any
+# event, and the sync trigger goes out between trials about once a minute (see clocksync.py)
+clock_sync = ClockSync(core.getTime, events.sink, triggers, sync_code=FIXED_TRIGGERS['sync'])
+
+# ---------- Live Monitor ----------
+# Every event, late onsets and dropped frames are also published to a local UDP port without
+# ever blocking; run monitor.py in a second terminal to follow the session
+events.monitor = MonitorStream(participant=participant_id, list=os.path.abspath(stimuli_path),
+                               trials=len(plan), blocks=plan.blocks)
+timing.monitor = events.monitor
+
+events.add(journal.SESSION_START, experiment_start, aux=first_space)
+if postfix: # Mark resume point in logs (trial to restart, word it was interrupted at)
+    events.add(journal.RESUME_DETECTED, experiment_start, resume_trial, interrupted_word)
+triggers.log = lambda code, written_at: events.add(journal.TRIGGER, written_at, code=code)
+
+# ---------- Checkpoint ----------
+# Updated after every word and trial; 'trial' is the next trial to run. A resumed session
+# restarts the interrupted trial from its first word.
+checkpoint = Checkpoint(checkpoint_filename, core.getTime, participant=participant_id,
+                        list_sha256=list_hash, trial=resume_trial, word=-1,
+                        block=plan.block_of(resume_trial),
+                        journal=journal_filename.replace('.bin', f'{postfix}.bin'))
+
+
+# ---------- Pause ----------
+# Emergency pause: ESCAPE during a word or question, SPACE to continue, Q to quit
+def pause():
+    events.add(journal.PAUSE_START, core.getTime())
+    presenter.flip(stims.pause)
+    events.sync()
+
+    # A code written on the pause flip is cleared between polls
+    key, _ = kb.wait(['q', 'space'], idle=triggers.update)
+    if key == 'q':
+        raise KeyboardInterrupt("Experiment exited.")
+    events.add(journal.PAUSE_RESUME, core.getTime())
+
+
+# Called once per frame while a word is on screen; True tells the presenter the word was paused
+def pause_during_word(frame):
+    if kb.pressed('escape'):
+        pause()
+        return True
+    return False
+
+# ---------- Real-time Mode ----------
+# No automatic garbage collection (it runs during the pre-fixation blank and block breaks),
+# raised priority and, with PIN_CPU set, one core for the trial loop (see realtime.py)
+PIN_CPU = None  # e.g. 2
+realtime = RealtimeMode(cpu=PIN_CPU).enter()
+print(realtime.status_line())
 
 # ---------- Trial Loop ----------
+# The sentence onset code goes out onset_lead refreshes before the first word, on the blank:
+# by then the line is clear again and the first word's code goes out on its own flip
+onset_lead = min(triggers.busy_frames(presenter.frame_duration), frames['post_blank'] - 1)
 try:
-    for block in range(num_blocks):
-        start = block * block_size
-        end = total_trials if block == num_blocks - 1 else (block + 1) * block_size
-        block_df = stimuli_df.iloc[start:end].reset_index(drop=True)
-
-        for i, (_, row) in enumerate(block_df.iterrows()):
-            trial_num = start + i
-            print(f"Trial {trial_num + 1} of {total_trials}")  # Display trial progress in terminal
-            if trial_num < resume_trial:
-                continue # Skip trials already completed before a crash
+    # Start directly at the block and trial not completed before a crash
+    for block in range(plan.block_of(resume_trial), len(plan.blocks)):
+        start, end = plan.blocks[block]
 
-            # Trial fixation cross
-            win.flip()
-            core.wait(0.250) # Blank screen duration
-            visual.TextStim(win, text='+', color='black', height=50).draw()
-            win.flip()
-            core.wait(1.0) # Fixation cross duration
-            win.flip()
-            core.wait(0.1) # Blank screen duration
+        for trial_num in range(max(start, resume_trial), end):
+            # Display trial progress in terminal
+            print(f"Trial {trial_num + 1} of {total_trials} (about {minutes(timeline.remaining(trial_num))} left)")
 
             # Retrieve trial content
-            sentence_id = row['id']
-            sentence = row['sentence']
-            question = row.get('question', '')
-            correct_answer = row.get('correct_answer', '')
-            is_question = str(sentence_id).startswith("Q_")
+            sentence_id = plan.ids[trial_num]
+            is_question = plan.is_question[trial_num]
             response = ''
-            now_event = str(timedelta(seconds=core.getTime() - experiment_start))
-            now_real = datetime.now().strftime('%H:%M:%S')
+            rt = 0.0
+
+            # Trial fixation cross
+            timing.trial_started(trial_num)
+            blank_onset = presenter.flip()
+            # Build this trial's stimuli while the blank screen is up
+            if is_question:
+                question_stim = stims.prepare_question(plan.questions[trial_num])
+            else:
+                words, word_codes = plan.trial_words(trial_num)
+                word_stims = stims.prepare_words(words)
+            realtime.collect()  # While the blank is up
+            presenter.hold(None, frames['pre_blank'], blank_onset) # Blank screen duration
+            presenter.show(stims.fixation, frames['fixation']) # Fixation cross duration
+            if is_question:
+                presenter.show(None, frames['post_blank']) # Blank screen duration
+            else:
+                presenter.show(None, frames['post_blank'] - onset_lead) # Blank screen duration
+                triggers.arm(plan.onset_codes[trial_num]) # Trigger for sentence onset
+                presenter.show(None, onset_lead)
+
+            trial_start = core.getTime()
 
             # If the sentence is a question, display it and collect yes/no response
             if is_question:
-                #Trigger for Question
-                parallel.setData(254)
-                # Short pulse du    ration using core.wait
-                core.wait(0.01)  # Adjust the delay if needed
-                # Reset the parallel port (clear the trigger)
-                parallel.setData(0)
-                stim = visual.TextStim(win, text=f"{sentence}\n\n(Πατήστε N για Ναι, O για Όχι)", color='black', height=28, wrapWidth=800) #Press N for yes, O for No
-                stim.draw()
-                win.flip()
+                #Trigger for Question, written when the question appears
+                triggers.arm(plan.question_code)
+                kb.start_response_clock(win)  # rt counts from the question flip
+                question_onset = presenter.flip(question_stim)
+                events.add(journal.QUESTION, question_onset, trial_num, code=plan.question_code,
+                           sentence_id=sentence_id)
+                # Sleep until N, O or ESCAPE; the trigger line is cleared between polls
                 while True:
-                    keys = event.getKeys()
-                    # Pause feature during question
-                    if 'escape' in keys:
-                        pause_start = core.getTime() - experiment_start
-                        timestamp = str(timedelta(seconds=pause_start))
-                        real = datetime.now().strftime('%H:%M:%S.%f')[:-3]
-
-                        word_log.append(
-                            {'trial_num': '', 'sentence_id': 'PAUSE_START', 'word': '', 'event_time': timestamp,
-                             'real_time': real})
-                        trial_data.append(
-                            {'trial_num': '', 'sentence_id': 'PAUSE_START', 'sentence': '', 'question': '',
-                             'correct_answer': '', 'response': '', 'event_time': timestamp, 'real_time': real})
-
-                        visual.TextStim(win, text='ΠΑΥΣΗ\nSPACE: συνέχεια, Q: έξοδος', height=30, color='black').draw()
-                        win.flip()
-
-                        while True:
-                            cont_keys = event.waitKeys()
-                            if 'q' in cont_keys:
-                                raise KeyboardInterrupt("Experiment exited.")
-                            elif 'space' in cont_keys:
-                                pause_end = core.getTime() - experiment_start
-                                timestamp = str(timedelta(seconds=pause_end))
-                                real = datetime.now().strftime('%H:%M:%S.%f')[:-3]
-
-                                word_log.append({'trial_num': '', 'sentence_id': 'PAUSE_RESUME', 'word': '',
-                                                 'event_time': timestamp, 'real_time': real})
-                                trial_data.append(
-                                    {'trial_num': '', 'sentence_id': 'PAUSE_RESUME', 'sentence': '', 'question': '',
-                                     'correct_answer': '', 'response': '', 'event_time': timestamp, 'real_time': real})
-                                break
-
-                    elif 'n' in keys or 'o' in keys:
-                        response = keys[0]
+                    key, rt = kb.wait(['n', 'o', 'escape'], idle=triggers.update)
+                    if key != 'escape':
+                        response = key
                         break
+                    # Pause feature during question, then show the question again (rt restarts)
+                    pause()
+                    kb.start_response_clock(win)
+                    presenter.flip(question_stim)
             # Present sentence word-by-word, with 450ms per word
             else:
-                words = sentence.split()
-                #Trigger for Question
-                parallel.setData(1)
-                # Short pulse du    ration using core.wait
-                core.wait(0.01)  # Adjust the delay if needed
-                # Reset the parallel port (clear the trigger)
-                parallel.setData(0)
-                for word in words:
-                    word_time = core.getTime() - experiment_start
-                    visual.TextStim(win, text=word, color='black', height=40).draw()
-                    parallel.setData(100)
-                    win.flip()
-                    word_log.append({'trial_num': trial_num + 1, 'sentence_id': sentence_id, 'word': word,
-                                     'event_time': str(timedelta(seconds=word_time)),
-                                     'real_time': datetime.now().strftime('%H:%M:%S.%f')[:-3]
-})
-                    # Check for pause during word display
-                    for _ in range(45):
-                        if 'escape' in event.getKeys():
-                            pause_start = core.getTime() - experiment_start
-                            timestamp = str(timedelta(seconds=pause_start))
-                            real = datetime.now().strftime('%H:%M:%S.%f')[:-3]
-
-                            word_log.append(
-                                {'trial_num': '', 'sentence_id': 'PAUSE_START', 'word': '', 'event_time': timestamp,
-                                 'real_time': real})
-                            trial_data.append(
-                                {'trial_num': '', 'sentence_id': 'PAUSE_START', 'sentence': '', 'question': '',
-                                 'correct_answer': '', 'response': '', 'event_time': timestamp, 'real_time': real})
-
-                            visual.TextStim(win, text='ΠΑΥΣΗ\nSPACE: συνέχεια, Q: έξοδος', height=30,
-                                            color='black').draw()
-                            win.flip()
-
-                            while True:
-                                k = event.waitKeys()
-                                if 'q' in k:
-                                    raise KeyboardInterrupt("Experiment exited.")
-                                elif 'space' in k:
-                                    pause_end = core.getTime() - experiment_start
-                                    timestamp = str(timedelta(seconds=pause_end))
-                                    real = datetime.now().strftime('%H:%M:%S.%f')[:-3]
-
-                                    word_log.append({'trial_num': '', 'sentence_id': 'PAUSE_RESUME', 'word': '',
-                                                     'event_time': timestamp, 'real_time': real})
-                                    trial_data.append(
-                                        {'trial_num': '', 'sentence_id': 'PAUSE_RESUME', 'sentence': '', 'question': '',
-                                         'correct_answer': '', 'response': '', 'event_time': timestamp,
-                                         'real_time': real})
-                                    break
-                        core.wait(0.01) # 10ms * 45 times of the loop = 450ms word duration
-                        # To reset the trigger to 0 after 10ms
-                        if _ == 10:
-                            parallel.setData(0)
-                    win.flip() #blank screen
-                    core.wait(0.1) # Inter-word interval
+                for word_idx, (word_stim, word_code) in enumerate(zip(word_stims, word_codes)):
+                    triggers.arm(word_code)
+                    word_due = presenter.due # When the word should appear
+                    word_onset = presenter.flip(word_stim)
+                    events.add(journal.WORD, word_onset, trial_num, word_idx, code=word_code,
+                               sentence_id=sentence_id)
+                    checkpoint.update(word=word_idx)
+                    # 450ms word duration, checking for pause on every frame
+                    dropped = presenter.hold(word_stim, frames['word'], word_onset, on_frame=pause_during_word)
+                    paused = presenter.interrupted
+                    word_offset = presenter.show(None, frames['inter_word']) # Inter-word interval
+                    timing.word_shown(trial_num, word_idx, word_code, word_due, word_onset, word_offset,
+                                      dropped, paused)
 
 
             # Store response and trial metadata
-            trial_data.append({
-                'trial_num': trial_num + 1,
-                'sentence_id': sentence_id,
-                'sentence': sentence,
-                'question': question,
-                'correct_answer': correct_answer,
-                'response': response,
-                'event_time': now_event,
-                'real_time': now_real
-            })
-
+            events.add(journal.TRIAL, trial_start, trial_num, value=ord(response) if response else 0,
+                       aux=rt, sentence_id=sentence_id)
+            timeline.observe(trial_num, core.getTime() - blank_onset, rt)
+            timing.trial_ended()
+            # End of trial: get the journal onto disk without waiting for it
+            events.sync(wait=False)
+            checkpoint.update(trial=trial_num + 1, word=-1, block=block)
+            clock_sync.maybe_sync()
 
         # ---------- Inter-block Break ----------
-        if block < num_blocks - 1:
-            break_start = core.getTime()
-            word_log.append({'trial_num': '', 'sentence_id': f'BREAK_START_block{block + 1}', 'word': '',
-                             'event_time': str(timedelta(seconds=break_start - experiment_start)),
-                             'real_time': datetime.now().strftime('%H:%M:%S.%f')[:-3]
-                             })
-            trial_data.append({'trial_num': '', 'sentence_id': f'BREAK_START_block{block + 1}', 'sentence': '',
-                               'question': '', 'correct_answer': '', 'response': '',
-                               'event_time': str(timedelta(seconds=break_start - experiment_start)),
-                               'real_time': datetime.now().strftime('%H:%M:%S.%f')[:-3]
-                               })
+        if block < len(plan.blocks) - 1:
+            events.add(journal.BREAK_START, core.getTime(), value=block + 1)
 
             # Wait for participant to resume after break
-            visual.TextStim(win, text='Διάλειμμα\nΠατήστε SPACE για συνέχεια.', height=30, color='black').draw()
-            win.flip()
-            event.waitKeys(keyList=['space'])
-            break_end = core.getTime()
-            word_log.append({'trial_num': '', 'sentence_id': f'BREAK_END_block{block + 1}', 'word': '',
-                             'event_time': str(timedelta(seconds=break_end - experiment_start)),
-                             'real_time': datetime.now().strftime('%H:%M:%S.%f')[:-3]
-                             })
-            trial_data.append({'trial_num': '', 'sentence_id': f'BREAK_END_block{block + 1}', 'sentence': '',
-                               'question': '', 'correct_answer': '', 'response': '',
-                               'event_time': str(timedelta(seconds=break_end - experiment_start)),
-                               'real_time': datetime.now().strftime('%H:%M:%S.%f')[:-3]
-                               })
+            presenter.flip(stims.block_break)
+            realtime.collect()
+            events.sync()
+            kb.wait(['space'], idle=triggers.update)
+            events.add(journal.BREAK_END, core.getTime(), value=block + 1)
 
 # ---------- Crash Handling ----------
 except Exception as e:
@@ -292,32 +372,45 @@ except Exception as e:
 
 # ---------- Save Data ----------
 finally:
-    # Calculate total duration
-    total_time = str(timedelta(seconds=core.getTime() - experiment_start))
-    # If the experiment resumed after a crash, '_postcrash' suffix is added to the filenames.
-    # Resumed data is saved in a separate file and does not overwrite the original.
-    final_data_file = data_filename.replace('.csv', f'{postfix}.csv')
-    final_word_file = word_log_filename.replace('.csv', f'{postfix}.csv')
-
-    # Write trial data to CSV
-    with open(final_data_file, 'w', newline='', encoding='utf-8') as f:
-        writer = csv.writer(f)
-        writer.writerow([f"# First SPACE pressed at: {start_time_str}"])
-        writer.writerow([f"# Experiment duration: {total_time}"])
-        fieldnames = ['trial_num', 'sentence_id', 'sentence', 'question', 'correct_answer', 'response', 'event_time', 'real_time']
-        writer.writerow(fieldnames)
-        for row in trial_data:
-            writer.writerow([row.get(col, '') for col in fieldnames])
-
-    # Write word-by-word timing log
-    with open(final_word_file, 'w', newline='', encoding='utf-8') as wf:
-        writer = csv.DictWriter(wf, fieldnames=['trial_num', 'sentence_id', 'word', 'event_time', 'real_time'])
-        writer.writeheader()
-        writer.writerows(word_log)
+    realtime.exit()
+    triggers.release()
+    port.close()
+    # Record the end of the session (total duration) and flush the journal to disk
+    events.add(journal.SESSION_END, core.getTime())
+    clock_sync.stop()
+    events.wall_fit = clock_sync.fit()  # real_time of every logged event
+
+    # Export trial data, word-by-word timing and trigger times to CSV. Written from the in-memory
+    # store before the journal and checkpoint are closed, so a failed background write cannot
+    # stop the export
+    write_csv_logs(events, read_trial_list(stimuli_path),
+                   data_filename.replace('.csv', f'{postfix}.csv'),
+                   word_log_filename.replace('.csv', f'{postfix}.csv'),
+                   trigger_log_filename.replace('.csv', f'{postfix}.csv'))
+    # Trigger port write latency, the station's timing profile and the real-time mode of the trial loop
+    write_session_info(session_info_filename.replace('.json', f'{postfix}.json'), trigger=trigger_latency,
+                       timing_profile={key: value for key, value in profile.items() if key != 'trigger'},
+                       realtime=realtime.summary())
+    # Per-word presentation timing, per-trial/block summary and every flip timestamp
+    write_timing_logs(timing, presenter.flip_times, experiment_start, plan.block_of,
+                      timing_filename.replace('.csv', f'{postfix}.csv'),
+                      timing_summary_filename.replace('.csv', f'{postfix}.csv'),
+                      flip_times_filename.replace('.bin', f'{postfix}.bin'))
+
+    # Flush the journal and the last checkpoint to disk
+    close_errors = []
+    for close in (events.close, events.monitor.close, checkpoint.close):
+        try:
+            close()
+        except OSError as error:
+            logging.error(f'Background write failed: {error}')
+            close_errors.append(error)
 
     # Show end screen and exit
-    visual.TextStim(win, text="Το πείραμα ολοκληρώθηκε.\n\nΕυχαριστούμε!", color='black', height=30).draw() #The experiment is over. Thank you!
+    stims.end.draw() #The experiment is over. Thank you!
     win.flip()
-    event.waitKeys()
+    kb.wait(None)
     win.close()
+    if close_errors:
+        raise close_errors[0]
     core.quit()
@@ -1,71 +1,75 @@
 # --- Imports ---
+# Only what is needed up to the participant dialog is imported here. psychopy.visual and the
+# stimulus modules are imported once an ID has been entered, and the randomizer (pandas) only
+# when a new list has to be generated. A startup time breakdown is printed before the first trial.
+from startup import StartupTimer
+startup = StartupTimer()
+
 import os
-import csv
+import sys
 import traceback
-from datetime import timedelta, datetime
 import platform
 
-import pandas as pd
-from psychopy import visual, core, event, gui, logging
-from randomizer import randomize
+if '--dry-run' in sys.argv:
+    # Headless run with simulated window, keyboard, clock and port (see dryrun.py)
+    import dryrun
+    dryrun.install(sys.argv[1:])
+
+from psychopy import core, gui, logging
+import journal
+from journal import (EventJournal, completed_trials, completed_trials_csv, next_segment, read_trial_list,
+                     segment_postfix)
+from checkpoint import Checkpoint, file_hash, load_checkpoint
+from plan import CONDITION_TRIGGERS, load_plan
+from eventstore import EventStore, write_csv_logs, write_session_info
+from timing import TimingRecorder, write_timing_logs
+from clocksync import ClockSync
+from realtime import RealtimeMode
+from monitor import MonitorStream
+from timeline import Timeline, minutes
+from triggers import TriggerDispatcher
+import trigger_ports
+import calibration
+from calibration import SCHEDULE
+startup.mark('imports')
 
 # --- Trigger setup ---
-USE_PARALLEL = platform.system() == 'Windows'
+# trigger_config.json selects the station's backend (see trigger_ports.py). Without one:
+# the parallel port on Windows, otherwise a loopback port that only logs the codes.
+if platform.system() == 'Windows':
+    default_port = {'backend': 'parallel', 'address': 0x3FE8}
+else:
+    default_port = {'backend': 'loopback', 'log': True}
+port_config = trigger_ports.load_config(default_port)
+if port_config['backend'] == 'loopback':
+    logging.warning('No trigger hardware configured on this system. Using dummy trigger.')
+port = trigger_ports.open_port(port_config)
+trigger_latency = trigger_ports.calibrate(port)  # Saved with the session info
+startup.mark('trigger port')
 
-if USE_PARALLEL:
-    from psychopy import parallel
-    parallel.setPortAddress(0x3FE8)
+# Codes are armed with triggers.arm() and written on the next flip
+triggers = TriggerDispatcher(port.write, core.getTime, pulse_width=0.005)
 
-    def send_trigger(code):
-        parallel.setData(code)
-        core.wait(0.005)
-        parallel.setData(0)
-else:
-    logging.warning('Parallel port not available on this system. Using dummy trigger.')
-
-    def send_trigger(code):
-        logging.exp(f'[Mock trigger] Code {code} would have been sent.')
-
-
-# --- Pause/resume helper ---
-def check_pause(experiment_start, trial_data, word_log, win):
-    if 'escape' in event.getKeys():
-        pause_start = core.getTime() - experiment_start
-        timestamp = str(timedelta(seconds=pause_start))
-        real = datetime.now().strftime('%H:%M:%S.%f')[:-3]
-
-        trial_data.append({
-            'trial_num': '', 'sentence_id': 'PAUSE_START', 'sentence': '',
-            'question': '', 'correct_answer': '', 'response': '',
-            'event_time': timestamp, 'real_time': real
-        })
-        word_log.append({
-            'trial_num': '', 'sentence_id': 'PAUSE_START', 'word': '',
-            'event_time': timestamp, 'real_time': real
-        })
-
-        visual.TextStim(win, text='ΠΑΥΣΗ\nSPACE: συνέχεια, Q: έξοδος', height=30, color='black').draw()
-        win.flip()
-
-        while True:
-            keys = event.waitKeys()
-            if 'q' in keys:
-                raise KeyboardInterrupt("Experiment exited by user.")
-            elif 'space' in keys:
-                pause_end = core.getTime() - experiment_start
-                timestamp = str(timedelta(seconds=pause_end))
-                real = datetime.now().strftime('%H:%M:%S.%f')[:-3]
-
-                trial_data.append({
-                    'trial_num': '', 'sentence_id': 'PAUSE_RESUME', 'sentence': '',
-                    'question': '', 'correct_answer': '', 'response': '',
-                    'event_time': timestamp, 'real_time': real
-                })
-                word_log.append({
-                    'trial_num': '', 'sentence_id': 'PAUSE_RESUME', 'word': '',
-                    'event_time': timestamp, 'real_time': real
-                })
-                break
+
+# --- Pause/resume helpers ---
+def pause(events, stims, presenter, kb):
+    events.add(journal.PAUSE_START, core.getTime())
+    presenter.flip(stims.pause)
+    events.sync()
+
+    # A code written on the pause flip is cleared between polls
+    key, _ = kb.wait(['q', 'space'], idle=presenter.triggers.update)
+    if key == 'q':
+        raise KeyboardInterrupt("Experiment exited by user.")
+    events.add(journal.PAUSE_RESUME, core.getTime())
+
+
+def check_pause(events, stims, presenter, kb):
+    # Returns True if the session was paused
+    if kb.pressed('escape'):
+        pause(events, stims, presenter, kb)
+        return True
+    return False
 
 
 # --- Participant info ---
@@ -73,18 +77,119 @@ participant_info = {'Participant ID': ''}
 dlg = gui.DlgFromDict(dictionary=participant_info, title='Participant Info')
 if not dlg.OK:
     core.quit()
+startup.mark('participant dialog', waiting=True)
 
 participant_id = participant_info['Participant ID']
 output_dir = 'logs_experiment'
 os.makedirs(output_dir, exist_ok=True)
 
+journal_filename = os.path.join(output_dir, f'{participant_id}_journal.bin')
+checkpoint_filename = os.path.join(output_dir, f'{participant_id}_checkpoint.json')
 data_filename = os.path.join(output_dir, f'{participant_id}_data.csv')
 word_log_filename = os.path.join(output_dir, f'{participant_id}_word_log.csv')
+trigger_log_filename = os.path.join(output_dir, f'{participant_id}_trigger_log.csv')
+timing_filename = os.path.join(output_dir, f'{participant_id}_timing.csv')
+timing_summary_filename = os.path.join(output_dir, f'{participant_id}_timing_summary.csv')
+flip_times_filename = os.path.join(output_dir, f'{participant_id}_flip_times.bin')
+session_info_filename = os.path.join(output_dir, f'{participant_id}_session_info.json')
 stimuli_path = f'logs_order/{participant_id}_randomized_list.csv'
 os.makedirs(os.path.dirname(stimuli_path), exist_ok=True)
 
+# --- Resume logic ---
+resume_trial = 0
+interrupted_word = -1
+postfix = ''
+last_checkpoint = load_checkpoint(checkpoint_filename)
+
+if last_checkpoint is not None or os.path.exists(journal_filename) or os.path.exists(data_filename):
+    # The checkpoint says where the last session stopped; the journal, then the _data.csv, are
+    # the fallbacks for sessions recorded before checkpoints (or journals) were written
+    list_hash = file_hash(stimuli_path)
+    completed = 0
+    if last_checkpoint is not None:
+        if last_checkpoint['list_sha256'] != list_hash:
+            logging.warning(f'{stimuli_path} is not the list the last session was running.')
+            dlg_mismatch = gui.Dlg(title='Cannot resume')
+            dlg_mismatch.addText(f'{stimuli_path} has changed since the last session. '
+                                 'Restore it or use a new participant ID.')
+            dlg_mismatch.show()
+            core.quit()
+        completed = last_checkpoint['trial']
+        interrupted_word = last_checkpoint['word']
+    elif os.path.exists(journal_filename):
+        completed = completed_trials(journal_filename)
+    elif os.path.exists(data_filename):
+        completed = completed_trials_csv(data_filename)
+
+    startup.mark('resume check')
+
+    if completed:
+        resume_trial = completed
+        dlg_resume = gui.Dlg(title='Resume experiment?')
+        if interrupted_word >= 0:
+            dlg_resume.addText(f'Trial {resume_trial + 1} was interrupted at word {interrupted_word + 1}.')
+        dlg_resume.addText(f'Participant ID already exists. Resume from trial {resume_trial + 1}?')
+        dlg_resume.addField('Resume:', choices=['Yes', 'No'])
+        response = dlg_resume.show()
+
+        if dlg_resume.OK and response[0] == 'Yes':
+            postfix = segment_postfix(next_segment(journal_filename, data_filename))
+        else:
+            resume_trial = 0
+            interrupted_word = -1
+        startup.mark('resume dialog', waiting=True)
+    elif os.path.exists(data_filename):
+        # Earlier data whose trials could not be counted: start over, but never overwrite it
+        postfix = segment_postfix(next_segment(journal_filename, data_filename))
+        logging.warning(f'{data_filename} has no completed trials. Logging to {postfix} files.')
+else:
+    from randomizer import randomize  # pandas is only needed here
+    randomize(participant_id)
+    list_hash = file_hash(stimuli_path)
+    startup.mark('randomize')
+
 # --- Create window and show instructions ---
+from psychopy import visual
+from keyinput import KeyInput
+from presenter import RSVPPresenter
+from stimulus_pool import StimulusPool
+from word_textures import WordTextures
+startup.mark('psychopy.visual import')
+
 win = visual.Window(fullscr=False, color='white', units='pix')
+kb = KeyInput()  # Timestamped key presses; response times count from the question onset
+startup.mark('window')
+
+# Refresh rate and stability, flip latency, draw cost and trigger write latency of this station,
+# measured once and cached per machine and screen (see calibration.py)
+profile = calibration.preflight(win, trigger_latency)
+print(calibration.profile_line(profile))
+startup.mark('timing preflight')
+
+# The durations of calibration.SCHEDULE in refresh frames at the measured frame rate. A station
+# that cannot run them is refused, unless the experimenter chooses to run anyway
+presenter = RSVPPresenter(win, frame_rate=profile['frame_rate'], triggers=triggers)
+frames = {name: presenter.frames(seconds) for name, seconds in SCHEDULE.items()}
+problems, timing_warnings = calibration.check(profile, frames, pulse_width=triggers.pulse_width)
+for warning in timing_warnings:
+    logging.warning(f'Timing: {warning}')
+if problems and not calibration.confirm(problems):
+    win.close()
+    core.quit()
+# Word onsets/offsets, dropped frames and trigger delays (see timing.py)
+timing = TimingRecorder(presenter.frame_duration, frames['word'], triggers)
+presenter.timing = timing
+startup.mark('frame rate')
+
+# Words, trigger codes and blocks of equal numbers of trials, compiled from the list (cached
+# next to it). BLOCK_BY = 'time' cuts the blocks at equal expected durations instead
+BLOCK_BY = 'trials'
+plan = load_plan(stimuli_path, frames, CONDITION_TRIGGERS, num_blocks=4, list_hash=list_hash,
+                 block_by=BLOCK_BY)
+# Expected session length, and time left estimated from the trials run so far (see timeline.py)
+timeline = Timeline(plan, presenter.frame_duration)
+print(timeline.report(resume_trial))
+startup.mark('trial plan')
 
 instruction_text = (
     "Καλωσορίσατε!\n\n"
@@ -97,214 +202,193 @@ instruction_text = (
 visual.TextStim(win, text=instruction_text, color='black', height=30, wrapWidth=800).draw()
 win.flip()
 
-start_press_time = core.getTime()
-event.waitKeys(keyList=['space'])
-start_time_str = str(timedelta(seconds=core.getTime() - start_press_time))
-
+# Fixation, pause, question and break screens, built once for the session. Words are shown as
+# pre-rendered textures: those of the plan are loaded now (rendered once and kept on disk)
+stims = StimulusPool(win, textures=WordTextures(win, height=40, color='black'))
+startup.mark('instructions + stimuli')
+stims.textures.preload(plan.words)
+startup.mark('word textures')
+print(stims.textures.report())
+print(startup.report())
 
-# --- Resume logic ---
-trial_data = []
-word_log = []
-resume_trial = 0
-postfix = ''
-
-if os.path.exists(data_filename):
-    with open(data_filename, 'r', encoding='utf-8') as f:
-        lines = list(csv.reader(f))
-        header_idx = next(i for i, row in enumerate(lines) if 'trial_num' in row)
-        completed = [int(row[0]) for row in lines[header_idx + 1:] if row[0].isdigit()]
-
-        if completed:
-            resume_trial = max(completed)
-            dlg_resume = gui.Dlg(title='Resume experiment?')
-            dlg_resume.addText(f'Participant ID already exists. Resume from trial {resume_trial + 1}?')
-            dlg_resume.addField('Resume:', choices=['Yes', 'No'])
-            response = dlg_resume.show()
-
-            if dlg_resume.OK and response[0] == 'Yes':
-                postfix = '_postcrash'
-                timestamp = str(timedelta(seconds=core.getTime()))
-                real = datetime.now().strftime('%H:%M:%S.%f')[:-3]
-
-                trial_data.append({
-                    'trial_num': '', 'sentence_id': 'RESUME_DETECTED', 'sentence': '',
-                    'question': '', 'correct_answer': '', 'response': '',
-                    'event_time': timestamp, 'real_time': real
-                })
-                word_log.append({
-                    'trial_num': '', 'sentence_id': 'RESUME_DETECTED', 'word': '',
-                    'event_time': timestamp, 'real_time': real
-                })
-            else:
-                resume_trial = 0
-
-    stimuli_df = pd.read_csv(stimuli_path)
-else:
-    stimuli_df = randomize(participant_id)
-    stimuli_df.to_csv(stimuli_path, index=False)
+start_press_time = core.getTime()
+kb.wait(['space'])
+first_space = core.getTime() - start_press_time
 
 # --- Timing setup ---
 experiment_start = core.getTime()
 
-# --- Block setup ---
-total_trials = len(stimuli_df)
-num_blocks = 4
-block_size = total_trials // num_blocks
-
-fieldnames = ['trial_num', 'sentence_id', 'sentence', 'question',
-              'correct_answer', 'response', 'event_time', 'real_time']
+# --- Event journal ---
+# Every event goes through events.add(): it is kept in compact in-memory columns and written
+# to the journal by a background thread; the CSV logs are written from the store at the end.
+# A resumed session goes to separate '_postcrash' files ('_postcrash2', ... after later
+# crashes), so the original logs and earlier resumed segments are never overwritten.
+events = EventStore(EventJournal(journal_filename.replace('.bin', f'{postfix}.bin')))
+
+# --- Clock alignment ---
+# Paired PsychoPy/wall-clock samples go into the journal once a second, the first before any
+# event, and the sync trigger goes out between trials about once a minute (see clocksync.py)
+clock_sync = ClockSync(core.getTime, events.sink, triggers, sync_code=CONDITION_TRIGGERS['sync'])
+
+# --- Live monitor ---
+# Every event, late onsets and dropped frames are also published to a local UDP port without
+# ever blocking; run monitor.py in a second terminal to follow the session
+events.monitor = MonitorStream(participant=participant_id, list=os.path.abspath(stimuli_path),
+                               trials=len(plan), blocks=plan.blocks)
+timing.monitor = events.monitor
+
+events.add(journal.SESSION_START, experiment_start, aux=first_space)
+if postfix:
+    events.add(journal.RESUME_DETECTED, experiment_start, resume_trial, interrupted_word)
+triggers.log = lambda code, written_at: events.add(journal.TRIGGER, written_at, code=code)
+
+# --- Checkpoint ---
+# Updated after every word and trial; 'trial' is the next trial to run. A resumed session
+# restarts the interrupted trial from its first word.
+checkpoint = Checkpoint(checkpoint_filename, core.getTime, participant=participant_id,
+                        list_sha256=list_hash, trial=resume_trial, word=-1,
+                        block=plan.block_of(resume_trial),
+                        journal=os.path.basename(events.sink.path))
+
+
+def pause_during_word(frame):
+    return check_pause(events, stims, presenter, kb)
+
+
+# --- Real-time mode ---
+# No automatic garbage collection (it runs during the pre-fixation blank and block breaks),
+# raised priority and, with PIN_CPU set, one core for the trial loop (see realtime.py)
+PIN_CPU = None  # e.g. 2
+realtime = RealtimeMode(cpu=PIN_CPU).enter()
+print(realtime.status_line())
 
 # --- Trial loop ---
+# The trial onset code goes out onset_lead refreshes before the first word, on the blank: by
+# then the line is clear again and the first word's code goes out on its own flip
+onset_lead = min(triggers.busy_frames(presenter.frame_duration), frames['post_blank'] - 1)
 try:
-    for block in range(num_blocks):
-        start = block * block_size
-        end = total_trials if block == num_blocks - 1 else (block + 1) * block_size
-        block_df = stimuli_df.iloc[start:end].reset_index(drop=True)
-
-        for i, (_, row) in enumerate(block_df.iterrows()):
-            trial_num = start + i
-            if trial_num < resume_trial:
-                continue
-
-            win.flip()
-            core.wait(0.25)
-            visual.TextStim(win, text='+', color='black', height=50).draw()
-            win.flip()
-            core.wait(1.0)
-            win.flip()
-            core.wait(0.1)
-
-            sentence_id = row['id']
-            sentence = row['sentence']
-            question = row.get('question', '')
-            correct_answer = row.get('correct_answer', '')
-            is_question = str(sentence_id).startswith('Q_')
+    # A resumed session starts directly at the block and trial not completed before the crash
+    for block in range(plan.block_of(resume_trial), len(plan.blocks)):
+        start, end = plan.blocks[block]
+
+        for trial_num in range(max(start, resume_trial), end):
+            sentence_id = plan.ids[trial_num]
+            is_question = plan.is_question[trial_num]
             response = ''
-            now_event = str(timedelta(seconds=core.getTime() - experiment_start))
-            now_real = datetime.now().strftime('%H:%M:%S')
+            rt = 0.0
 
+            # Build this trial's stimuli and collect garbage while the blank screen is up
+            timing.trial_started(trial_num)
+            blank_onset = presenter.flip()
             if is_question:
-                send_trigger(50)
-                stim = visual.TextStim(
-                    win,
-                    text=f'{sentence}\n\n(Πατήστε N για Ναι, O για Όχι)',
-                    color='black',
-                    height=28,
-                    wrapWidth=800
-                )
-                stim.draw()
-                win.flip()
+                question_stim = stims.prepare_question(plan.questions[trial_num])
+            else:
+                words, word_codes = plan.trial_words(trial_num)
+                word_stims = stims.prepare_words(words)
+            realtime.collect()
+            presenter.hold(None, frames['pre_blank'], blank_onset)
+
+            presenter.show(stims.fixation, frames['fixation'])
+            if is_question:
+                presenter.show(None, frames['post_blank'])
+            else:
+                presenter.show(None, frames['post_blank'] - onset_lead)
+                triggers.arm(plan.onset_codes[trial_num])  # Trial onset
+                presenter.show(None, onset_lead)
 
+            trial_start = core.getTime()
+
+            if is_question:
+                triggers.arm(plan.question_code)
+                kb.start_response_clock(win)
+                question_onset = presenter.flip(question_stim)
+                events.add(journal.QUESTION, question_onset, trial_num, code=plan.question_code,
+                           sentence_id=sentence_id)
+
+                # Sleep until N, O or ESCAPE; the trigger line is cleared between polls
                 while True:
-                    keys = event.getKeys()
-                    if 'escape' in keys:
-                        check_pause(experiment_start, trial_data, word_log, win)
-                    elif 'n' in keys or 'o' in keys:
-                        response = keys[0]
+                    key, rt = kb.wait(['n', 'o', 'escape'], idle=triggers.update)
+                    if key != 'escape':
+                        response = key
                         break
+                    pause(events, stims, presenter, kb)
+                    kb.start_response_clock(win)
+                    presenter.flip(question_stim)
             else:
-                words = sentence.split()
-
-                try:
-                    condition_code = int(row['condition_code'])
-                except Exception:
-                    logging.warning(f"Missing or invalid condition_code in row: {row}")
-                    condition_code = 99
-
-                try:
-                    target_word_index = int(row['target_word'])  # 1-indexed!
-                except Exception:
-                    logging.warning(f"Missing or invalid target_word in row: {row}")
-                    target_word_index = -1
-
-                send_trigger(condition_code)  # Trial onset
-
-                for word_idx, word in enumerate(words, start=1):  # start=1 for 1-indexing
-                    word_time = core.getTime() - experiment_start
-                    visual.TextStim(win, text=word, color='black', height=40).draw()
-
-                    if word_idx == target_word_index:
-                        send_trigger(condition_code + 3)
-                    else:
-                        send_trigger(condition_code + 1)
-
-                    win.flip()
-
-                    word_log_entry = {
-                        'trial_num': trial_num + 1,
-                        'sentence_id': sentence_id,
-                        'word': word,
-                        'event_time': str(timedelta(seconds=word_time)),
-                        'real_time': datetime.now().strftime('%H:%M:%S.%f')[:-3]
-                    }
-                    word_log.append(word_log_entry)
-
-                    with open(word_log_filename, 'a', newline='', encoding='utf-8') as wf:
-                        writer = csv.DictWriter(wf, fieldnames=word_log_entry.keys())
-                        if wf.tell() == 0:
-                            writer.writeheader()
-                        writer.writerow(word_log_entry)
-
-                    for _ in range(45):  # 450ms duration in 10ms steps
-                        check_pause(experiment_start, trial_data, word_log, win)
-                        core.wait(0.01)
-
-                    win.flip()
-                    core.wait(0.1)
-
-            trial_entry = {
-                'trial_num': trial_num + 1,
-                'sentence_id': sentence_id,
-                'sentence': sentence,
-                'question': question,
-                'correct_answer': correct_answer,
-                'response': response,
-                'event_time': now_event,
-                'real_time': now_real
-            }
-            trial_data.append(trial_entry)
-
-            with open(data_filename, 'a', newline='', encoding='utf-8') as f:
-                writer = csv.DictWriter(f, fieldnames=fieldnames)
-                if f.tell() == 0:
-                    writer.writeheader()
-                writer.writerow(trial_entry)
-
-        if block < num_blocks - 1:
-            visual.TextStim(win, text='Διάλειμμα\nΠατήστε SPACE για συνέχεια.',
-                            height=30, color='black').draw()
-            win.flip()
-            event.waitKeys(keyList=['space'])
+                # Word codes are condition_code + 1, or + 3 for the target word
+                for word_idx, (word_stim, word_code) in enumerate(zip(word_stims, word_codes)):
+                    triggers.arm(word_code)
+
+                    word_due = presenter.due
+                    word_onset = presenter.flip(word_stim)
+                    events.add(journal.WORD, word_onset, trial_num, word_idx, code=word_code,
+                               sentence_id=sentence_id)
+                    checkpoint.update(word=word_idx)
+
+                    dropped = presenter.hold(word_stim, frames['word'], word_onset, on_frame=pause_during_word)
+                    paused = presenter.interrupted
+                    word_offset = presenter.show(None, frames['inter_word'])
+                    timing.word_shown(trial_num, word_idx, word_code, word_due, word_onset, word_offset,
+                                      dropped, paused)
+
+            events.add(journal.TRIAL, trial_start, trial_num, value=ord(response) if response else 0,
+                       aux=rt, sentence_id=sentence_id)
+            timeline.observe(trial_num, core.getTime() - blank_onset, rt)
+            timing.trial_ended()
+
+            # End of trial: get the journal onto disk without waiting for it
+            events.sync(wait=False)
+            checkpoint.update(trial=trial_num + 1, word=-1, block=block)
+            clock_sync.maybe_sync()
+
+        if block < len(plan.blocks) - 1:
+            events.add(journal.BREAK_START, core.getTime(), value=block + 1)
+            events.sync()
+            presenter.flip(stims.block_break)
+            realtime.collect()
+            print(f'Break after block {block + 1} of {len(plan.blocks)}: about '
+                  f'{minutes(timeline.remaining(end))} of trials left')
+            kb.wait(['space'], idle=triggers.update)
+            events.add(journal.BREAK_END, core.getTime(), value=block + 1)
 
 except Exception as e:
     print('Experiment crashed. Saving data ...')
     traceback.print_exc()
 
 finally:
-    total_time = str(timedelta(seconds=core.getTime() - experiment_start))
-    final_data_file = data_filename.replace('.csv', f'{postfix}.csv')
-    final_word_file = word_log_filename.replace('.csv', f'{postfix}.csv')
-
-    with open(final_data_file, 'w', newline='', encoding='utf-8') as f:
-        writer = csv.writer(f)
-        writer.writerow([f'# First SPACE pressed at: {start_time_str}'])
-        writer.writerow([f'# Experiment duration: {total_time}'])
-        writer.writerow(fieldnames)
-        for row in trial_data:
-            writer.writerow([row.get(col, '') for col in fieldnames])
-
-    with open(final_word_file, 'w', newline='', encoding='utf-8') as wf:
-        writer = csv.DictWriter(wf, fieldnames=['trial_num', 'sentence_id', 'word', 'event_time', 'real_time'])
-        writer.writeheader()
-        writer.writerows(word_log)
-
-    visual.TextStim(
-        win,
-        text="Το πείραμα ολοκληρώθηκε.\n\nΕυχαριστούμε!",
-        color='black',
-        height=30).draw()
-
+    realtime.exit()
+    triggers.release()
+    port.close()
+    events.add(journal.SESSION_END, core.getTime())
+    clock_sync.stop()
+    events.wall_fit = clock_sync.fit()  # real_time of every logged event
+
+    # The CSV logs come from the in-memory store, before the journal and checkpoint are closed,
+    # so a failed background write cannot stop the export
+    write_csv_logs(events, read_trial_list(stimuli_path),
+                   data_filename.replace('.csv', f'{postfix}.csv'),
+                   word_log_filename.replace('.csv', f'{postfix}.csv'),
+                   trigger_log_filename.replace('.csv', f'{postfix}.csv'))
+    write_session_info(session_info_filename.replace('.json', f'{postfix}.json'), trigger=trigger_latency,
+                       timing_profile={key: value for key, value in profile.items() if key != 'trigger'},
+                       realtime=realtime.summary())
+    write_timing_logs(timing, presenter.flip_times, experiment_start, plan.block_of,
+                      timing_filename.replace('.csv', f'{postfix}.csv'),
+                      timing_summary_filename.replace('.csv', f'{postfix}.csv'),
+                      flip_times_filename.replace('.bin', f'{postfix}.bin'))
+
+    close_errors = []
+    for close in (events.close, events.monitor.close, checkpoint.close):
+        try:
+            close()
+        except OSError as error:
+            logging.error(f'Background write failed: {error}')
+            close_errors.append(error)
+
+    stims.end.draw()
     win.flip()
-    event.waitKeys()
+    kb.wait(None)
     win.close()
+    if close_errors:
+        raise close_errors[0]
     core.quit()
@@ -0,0 +1,325 @@
+# Benchmarks.
+# Times the parts of the experiment whose speed matters and compares the results with the
+# stored baseline of this machine:
+#   randomizer  solve_order() on the stimulus pool at half, full and four times its size
+#               under three constraint settings, with the restarts each needed, and a whole
+#               randomize() of stimuli.csv
+#   logs        cost per event in the trial loop, and until everything is on disk, of the
+#               event journal, the background CSV writer and one CSV append per word
+#   resume      finding the resume point from the checkpoint, from the journal of a long
+#               session and by scanning a long _data.csv
+#   loop        loop overhead per flip and per trial of a whole dry-run session (dryrun.py)
+# Every result is lower-is-better. Baselines are JSON files per machine in benchmark_baselines/;
+# a result more than --tolerance above its baseline (and more than the noise floor of its unit)
+# is reported as a regression and the exit status is 1.
+#
+#   python benchmarks.py --save    (record the baseline of this machine)
+#   python benchmarks.py           (compare with it)
+#   python benchmarks.py --only randomizer,resume --tolerance 0.5
+
+import argparse
+import csv
+import glob
+import json
+import os
+import platform
+import random
+import re
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+import journal
+from checkpoint import Checkpoint, load_checkpoint
+from eventstore import EventStore, format_event_time, format_real_time
+from journal import DATA_FIELDNAMES, WORD_FIELDNAMES, EventJournal, completed_trials, read_trial_list
+from logwriter import BackgroundWriter
+from randomizer import InfeasibleOrderError, question_slots, randomize, solve_order
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+BASELINE_DIR = os.path.join(HERE, 'benchmark_baselines')
+
+POOL_SCALES = (0.5, 1, 4)
+# max_repeat, min_code_distance; condition_code 10 has 150 of the 405 sentences, so 2 apart is
+# the tightest spacing stimuli.csv allows
+CONSTRAINTS = {'default': (1, 2), 'no_distance': (1, 1), 'loose': (2, 1)}
+
+# Differences below these (by the unit at the end of the result name) are never a regression
+NOISE_FLOOR = {'seconds': 1e-4, 'restarts': 0, 'us_per_event': 0.5, 'us_per_event_to_disk': 0.5,
+               'us_per_flip': 0.5, 'ms_per_trial': 0.05}
+
+
+def best_of(function, repeat, number=1):
+    # Seconds per call: the shortest of repeat runs of number calls each
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for _ in range(number):
+            function()
+        times.append((time.perf_counter() - start) / number)
+    return min(times)
+
+
+class _InDirectory:
+    def __init__(self, path):
+        self.path = path
+
+    def __enter__(self):
+        self._previous = os.getcwd()
+        os.chdir(self.path)
+
+    def __exit__(self, *exc):
+        os.chdir(self._previous)
+
+
+# --- Randomizer ---
+def _pool(stimuli, scale):
+    # The stimulus pool with every condition scaled alike (its rows repeated or cut)
+    groups = {}
+    for row in stimuli:
+        groups.setdefault(row['condition'], []).append(row)
+    pool = []
+    for rows in groups.values():
+        pool.extend(rows[i % len(rows)] for i in range(max(1, round(len(rows) * scale))))
+    return pool
+
+
+def bench_randomizer(results, tmp, repeat):
+    stimuli = read_trial_list(os.path.join(HERE, 'stimuli.csv'))
+    for scale in POOL_SCALES:
+        pool = _pool(stimuli, scale)
+        conditions = [row['condition'] for row in pool]
+        codes = [int(float(row['condition_code'])) for row in pool]
+        is_question = [row['question'].strip() != '' for row in pool]
+        slots = question_slots(is_question.count(False), is_question.count(True), 26)
+
+        for name, (max_repeat, min_code_distance) in CONSTRAINTS.items():
+            key = f'randomizer.solve_order.{len(pool)}.{name}'
+            stats = {}
+
+            def run():
+                solve_order(conditions, codes, is_question, slots, max_repeat, min_code_distance,
+                            rng=random.Random(1), stats=stats)
+
+            try:
+                results[key + '.seconds'] = best_of(run, repeat, number=max(1, round(4 / scale)))
+            except InfeasibleOrderError as e:
+                print(f'{key}: {e}')
+                continue
+            results[key + '.restarts'] = stats['restarts']
+
+    shutil.copy(os.path.join(HERE, 'stimuli.csv'), tmp)
+    with _InDirectory(tmp):
+        results['randomizer.randomize.seconds'] = best_of(
+            lambda: randomize('BENCH', seed=1, verbose=False), repeat)
+
+
+# --- Log writing ---
+def _journal_writer(path):
+    store = EventStore(EventJournal(path))
+    return lambda i: store.add(journal.WORD, i * 0.5, i // 10, i % 10, 101, sentence_id='S1'), store.close
+
+
+class _CsvWriter(BackgroundWriter):
+    # The background CSV writer the journal replaced: a header row, then one row per appended dict
+
+    def __init__(self, path, fieldnames):
+        super().__init__(path, 'w')
+        self._writer = csv.DictWriter(self._file, fieldnames=fieldnames, restval='')
+        self._writer.writeheader()
+        self._start()
+
+    def _write_items(self, items):
+        self._writer.writerows(items)
+
+
+def _csv_writer(path):
+    log = _CsvWriter(path, WORD_FIELDNAMES)
+
+    def add(i):
+        log.append({'trial_num': i // 10 + 1, 'sentence_id': 'S1', 'word': 'λέξη',
+                    'event_time': format_event_time(i * 0.5, 0.0), 'real_time': format_real_time(time.time())})
+    return add, log.close
+
+
+def _append_per_word(path):
+    # Open, write one row and close for every word
+    def add(i):
+        with open(path, 'a', newline='', encoding='utf-8') as f:
+            csv.writer(f).writerow([i // 10 + 1, 'S1', 'λέξη', format_event_time(i * 0.5, 0.0),
+                                    datetime.now().strftime('%H:%M:%S.%f')[:-3]])
+    return add, lambda: None
+
+
+LOG_WRITERS = {'journal': _journal_writer, 'csv_writer': _csv_writer, 'append_per_word': _append_per_word}
+
+
+def bench_logs(results, tmp, repeat, events=20000):
+    for name, make in LOG_WRITERS.items():
+        loop_times, total_times = [], []
+        for run in range(repeat):
+            path = os.path.join(tmp, f'{name}_{run}.log')
+            start = time.perf_counter()
+            add, close = make(path)
+            for i in range(events):
+                add(i)
+            looped = time.perf_counter()
+            close()
+            loop_times.append(looped - start)
+            total_times.append(time.perf_counter() - start)
+        results[f'logs.{name}.us_per_event'] = min(loop_times) / events * 1e6
+        results[f'logs.{name}.us_per_event_to_disk'] = min(total_times) / events * 1e6
+
+
+# --- Resume detection ---
+def _completed_from_data_csv(path):
+    # Highest trial_num in a _data.csv, as resume detection worked before checkpoints
+    completed = 0
+    with open(path, encoding='utf-8', newline='') as f:
+        for row in csv.DictReader(line for line in f if not line.startswith('#')):
+            if row['trial_num'].isdigit():
+                completed = max(completed, int(row['trial_num']))
+    return completed
+
+
+def bench_resume(results, tmp, repeat, trials=10000, words=12):
+    journal_path = os.path.join(tmp, 'resume_journal.bin')
+    sink = EventJournal(journal_path)
+    for trial in range(trials):
+        for word in range(words):
+            sink.record(journal.TRIGGER, trial + word * 0.01, code=101)
+            sink.record(journal.WORD, trial + word * 0.01, trial, word, 101)
+        sink.record(journal.TRIAL, trial + 0.5, trial)
+    sink.close()
+
+    data_path = os.path.join(tmp, 'resume_data.csv')
+    with open(data_path, 'w', newline='', encoding='utf-8') as f:
+        writer = csv.DictWriter(f, DATA_FIELDNAMES)
+        writer.writeheader()
+        for trial in range(trials):
+            writer.writerow({'trial_num': trial + 1, 'sentence_id': f'S{trial}', 'sentence': 'λέξη ' * words,
+                             'event_time': format_event_time(trial, 0.0), 'real_time': format_real_time(time.time())})
+
+    checkpoint_path = os.path.join(tmp, 'resume_checkpoint.json')
+    Checkpoint(checkpoint_path, time.perf_counter, trial=trials, word=-1, block=3).close()
+
+    assert completed_trials(journal_path) == _completed_from_data_csv(data_path) == trials
+    results['resume.checkpoint.seconds'] = best_of(lambda: load_checkpoint(checkpoint_path), repeat, number=1000)
+    results[f'resume.journal.{trials}.seconds'] = best_of(lambda: completed_trials(journal_path), repeat)
+    results[f'resume.data_csv.{trials}.seconds'] = best_of(lambda: _completed_from_data_csv(data_path), repeat)
+
+
+# --- Trial loop ---
+def bench_loop(results, tmp, repeat):
+    # A whole session of the Elena script under dryrun.py's simulated clock and window
+    for path in glob.glob(os.path.join(HERE, '*.py')) + [os.path.join(HERE, 'stimuli.csv')]:
+        shutil.copy(path, tmp)
+    with _InDirectory(tmp):
+        trials = len(randomize('BENCH', seed=1, verbose=False))
+
+    per_flip, per_trial = [], []
+    for _ in range(repeat):
+        out = subprocess.run([sys.executable, 'Experiment_trig_Elena.py', '--dry-run', '--participant', 'BENCH',
+                              '--resume', 'No'], cwd=tmp, capture_output=True, text=True, check=True).stdout
+        match = re.search(r'in ([\d.]+) s, (\d+) flips \(([\d.]+) us', out)
+        if match is None:
+            raise RuntimeError(f'No dry-run summary in the output:\n{out}')
+        per_flip.append(float(match.group(3)))
+        per_trial.append(float(match.group(1)) / trials * 1000)
+        shutil.rmtree(os.path.join(tmp, 'logs_experiment'), ignore_errors=True)
+    results['loop.us_per_flip'] = min(per_flip)
+    results['loop.ms_per_trial'] = min(per_trial)
+
+
+BENCHMARKS = {'randomizer': bench_randomizer, 'logs': bench_logs, 'resume': bench_resume, 'loop': bench_loop}
+
+
+def run_benchmarks(names, repeat=5, verbose=True):
+    results = {}
+    for name in names:
+        with tempfile.TemporaryDirectory() as tmp:
+            start = time.perf_counter()
+            BENCHMARKS[name](results, tmp, repeat)
+            if verbose:
+                print(f'{name}: {time.perf_counter() - start:.1f} s')
+    return results
+
+
+def baseline_path(machine=None):
+    return os.path.join(BASELINE_DIR, f'{machine or platform.node() or "default"}.json')
+
+
+def save_baseline(results, path):
+    # Merged into the existing baseline, so a partial run only updates its own entries
+    baseline = load_baseline(path) or {'results': {}}
+    baseline['results'].update(results)
+    baseline.update(machine=platform.node(), platform=platform.platform(), python=platform.python_version(),
+                    cpus=os.cpu_count(), saved=datetime.now().isoformat(timespec='seconds'))
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(baseline, f, indent=1, sort_keys=True)
+    os.replace(tmp_path, path)
+
+
+def load_baseline(path):
+    try:
+        with open(path, encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def compare(results, baseline, tolerance):
+    # (name, result, baseline, ratio) of every result more than tolerance above its baseline
+    regressions = []
+    for name, value in results.items():
+        reference = baseline.get(name)
+        if reference is None:
+            continue
+        floor = NOISE_FLOOR.get(name.rsplit('.', 1)[-1], 0)
+        if value > reference * (1 + tolerance) and value - reference > floor:
+            regressions.append((name, value, reference, value / reference if reference else float('inf')))
+    return regressions
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmark the randomizer, log writing, resume detection '
+                                                 'and the trial loop against a stored baseline.')
+    parser.add_argument('--only', default=','.join(BENCHMARKS), help='comma-separated: ' + ', '.join(BENCHMARKS))
+    parser.add_argument('--repeat', type=int, default=5, help='runs per measurement (the best counts)')
+    parser.add_argument('--save', action='store_true', help='store the results as the baseline of this machine')
+    parser.add_argument('--baseline', default=None, help='baseline JSON (default: the one of this machine)')
+    parser.add_argument('--tolerance', type=float, default=0.25, help='allowed slowdown before failing (0.25 = 25%%)')
+    args = parser.parse_args()
+
+    names = [name.strip() for name in args.only.split(',') if name.strip()]
+    unknown = set(names) - set(BENCHMARKS)
+    if unknown:
+        parser.error(f'unknown benchmarks: {", ".join(sorted(unknown))}')
+
+    results = run_benchmarks(names, args.repeat)
+    path = args.baseline or baseline_path()
+    baseline = (load_baseline(path) or {}).get('results', {})
+
+    width = max(map(len, results))
+    for name, value in results.items():
+        reference = baseline.get(name)
+        change = f'  ({value / reference - 1:+.0%} vs baseline)' if reference else ''
+        print(f'{name:<{width}}  {value:12.6g}{change}')
+
+    if args.save:
+        save_baseline(results, path)
+        print(f'Baseline saved to {path}')
+    elif not baseline:
+        print(f'No baseline at {path}; record one with --save')
+    else:
+        regressions = compare(results, baseline, args.tolerance)
+        for name, value, reference, ratio in regressions:
+            print(f'REGRESSION {name}: {value:.6g} vs baseline {reference:.6g} ({ratio:.2f}x)', file=sys.stderr)
+        if regressions:
+            sys.exit(f'{len(regressions)} benchmark(s) more than {args.tolerance:.0%} slower than the baseline')
+        print(f'No regressions against {path}')
@@ -0,0 +1,236 @@
+# Preflight timing calibration.
+# Before the instructions are shown, measure() checks what the station can do: the refresh rate,
+# how regular the flips are (interval spread and dropped refreshes over 120 blank flips), how
+# long win.flip() takes to return after the refresh (flip latency) and what drawing a word costs
+# as a TextStim (setText + draw) and as a pre-rendered ImageStim. The result is saved as a
+# profile per machine and screen under timing_profiles/; later startups load it and only check
+# the refresh rate over 30 flips, and measure again when that no longer matches or the profile
+# is older than max_age_days. The trigger write latency is measured at every startup
+# (trigger_ports.calibrate) and added to the profile.
+#
+# SCHEDULE holds the durations of the experiment in seconds; the scripts turn them into frame
+# counts at the measured rate. check() compares the profile with the schedule and returns
+# warnings (logged) and problems (the station cannot run the schedule as intended; the
+# experimenter is asked whether to run anyway).
+
+import argparse
+import hashlib
+import json
+import os
+import platform
+import time
+from datetime import datetime
+from statistics import fmean, pstdev
+
+PROFILE_DIR = 'timing_profiles'
+PROFILE_VERSION = 1
+
+# Durations in seconds. 'answer' is the expected question response time (timeline only)
+SCHEDULE = {
+    'pre_blank': 0.25,
+    'fixation': 1.0,
+    'post_blank': 0.1,
+    'word': 0.45,
+    'inter_word': 0.1,
+    'answer': 2.0,
+}
+SHOWN = ['pre_blank', 'fixation', 'post_blank', 'word', 'inter_word']  # durations on screen
+
+
+def _station(win):
+    import psychopy
+    return {'machine': platform.node(), 'screen': list(win.size), 'psychopy': getattr(psychopy, '__version__', '')}
+
+
+def profile_path(win, profile_dir=PROFILE_DIR):
+    station = _station(win)
+    digest = hashlib.sha1(json.dumps(station, sort_keys=True).encode()).hexdigest()[:8]
+    return os.path.join(profile_dir, f"{station['machine'] or 'station'}_{digest}.json")
+
+
+def _flip_intervals(win, flips):
+    # Intervals between flip timestamps and how long each flip took to return after its refresh
+    from psychopy import core
+
+    intervals, latencies = [], []
+    last = win.flip()
+    for _ in range(flips):
+        onset = win.flip()
+        latencies.append(core.getTime() - onset)
+        intervals.append(onset - last)
+        last = onset
+    return intervals, latencies
+
+
+def _draw_time(draw, draws):
+    start = time.perf_counter()
+    for i in range(draws):
+        draw(i)
+    return (time.perf_counter() - start) / draws
+
+
+def measure(win, flips=120, draws=60, word='λέξη'):
+    from PIL import Image
+    from psychopy import visual
+
+    frame_rate = win.getActualFrameRate(nIdentical=20, nMaxFrames=200, nWarmUpFrames=20)
+    intervals, latencies = _flip_intervals(win, flips)
+    frame_duration = 1.0 / frame_rate if frame_rate else fmean(intervals)
+
+    text = visual.TextStim(win, text=word, color='black', height=40)
+    words = [word, word.upper()]  # alternated, so every draw lays the text out again
+
+    def draw_text(i):
+        text.setText(words[i % 2])
+        text.draw()
+
+    image = visual.ImageStim(win, image=Image.new('RGBA', (128, 64), 'black'), units='pix', size=(128, 64))
+    text_draw = _draw_time(draw_text, draws)
+    image_draw = _draw_time(lambda i: image.draw(), draws)
+    win.clearBuffer()
+    win.flip()
+
+    return {
+        'version': PROFILE_VERSION,
+        'station': _station(win),
+        'measured': datetime.now().isoformat(timespec='seconds'),
+        'frame_rate': frame_rate,
+        'interval_sd': pstdev(intervals),
+        'max_interval': max(intervals),
+        'dropped': sum(interval > 1.5 * frame_duration for interval in intervals),
+        'flips': flips,
+        'flip_latency': fmean(latencies),
+        'max_flip_latency': max(latencies),
+        'text_draw': text_draw,
+        'image_draw': image_draw,
+    }
+
+
+def quick_check(win, profile, flips=30, tolerance=0.02):
+    # True if the refresh rate still matches the profile
+    if not profile.get('frame_rate'):
+        return False
+    intervals, _ = _flip_intervals(win, flips)
+    intervals.sort()
+    return abs(intervals[len(intervals) // 2] * profile['frame_rate'] - 1) <= tolerance
+
+
+def load_profile(path):
+    try:
+        with open(path, encoding='utf-8') as f:
+            profile = json.load(f)
+    except (OSError, ValueError):
+        return None
+    return profile if profile.get('version') == PROFILE_VERSION else None
+
+
+def save_profile(profile, path):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    stored = {key: value for key, value in profile.items() if key not in ('trigger', 'source')}
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(stored, f, indent=1)
+    os.replace(tmp_path, path)
+
+
+def preflight(win, trigger_latency=None, max_age_days=30, profile_dir=PROFILE_DIR):
+    # The station's profile: cached if it is recent and the refresh rate still matches, else measured
+    path = profile_path(win, profile_dir)
+    profile = load_profile(path)
+    if profile is not None:
+        age = datetime.now() - datetime.fromisoformat(profile['measured'])
+        if age.days < max_age_days and quick_check(win, profile):
+            profile['source'] = 'cached'
+        else:
+            profile = None
+    if profile is None:
+        profile = measure(win)
+        save_profile(profile, path)
+        profile['source'] = 'measured'
+    profile['trigger'] = trigger_latency
+    return profile
+
+
+def check(profile, frames, schedule=SCHEDULE, pulse_width=None):
+    # (problems, warnings) for running the schedule with these frame counts on this station
+    problems, warnings = [], []
+    frame_rate = profile.get('frame_rate')
+    if not frame_rate:
+        return ['The refresh rate could not be measured; durations in frames would be guesses'], warnings
+    frame = 1.0 / frame_rate
+
+    for name in SHOWN:
+        requested = schedule[name]
+        error = frames[name] * frame - requested
+        message = (f'{name}: {frames[name]} frames at {frame_rate:.2f} Hz last {frames[name] * frame * 1000:.1f} ms '
+                   f'instead of {requested * 1000:.0f} ms')
+        if abs(error) > 0.1 * requested:
+            problems.append(message)
+        elif abs(error) > 0.002:
+            warnings.append(message)
+
+    if profile['dropped'] > 0.01 * profile['flips']:
+        problems.append(f"{profile['dropped']} of {profile['flips']} refreshes dropped while flipping blank screens")
+    elif profile['interval_sd'] > 0.1 * frame:
+        warnings.append(f"Irregular refreshes: frame interval sd {profile['interval_sd'] * 1000:.2f} ms")
+    if profile['max_flip_latency'] > 0.5 * frame:
+        warnings.append(f"win.flip() returned up to {profile['max_flip_latency'] * 1000:.1f} ms after the refresh")
+
+    if profile['image_draw'] > 0.5 * frame:
+        problems.append(f"Drawing a word takes {profile['image_draw'] * 1000:.1f} ms of a {frame * 1000:.1f} ms frame")
+    elif profile['image_draw'] > 0.25 * frame:
+        warnings.append(f"Drawing a word takes {profile['image_draw'] * 1000:.1f} ms of a {frame * 1000:.1f} ms frame")
+    if profile['text_draw'] > frame:
+        warnings.append(f"Laying out text takes {profile['text_draw'] * 1000:.1f} ms (longer than a frame)")
+
+    trigger = profile.get('trigger')
+    if trigger and pulse_width:
+        if trigger['max'] > pulse_width:
+            problems.append(f"Trigger writes take up to {trigger['max'] * 1000:.2f} ms "
+                            f"(longer than the {pulse_width * 1000:.0f} ms pulse)")
+        elif trigger['mean'] > 0.001:
+            warnings.append(f"Trigger writes take {trigger['mean'] * 1000:.2f} ms on average")
+    return problems, warnings
+
+
+def confirm(problems):
+    # Asks the experimenter whether to run on a station that cannot meet the schedule
+    from psychopy import gui
+
+    dlg = gui.Dlg(title='Timing check failed')
+    for problem in problems:
+        dlg.addText(problem)
+    dlg.addField('Run anyway?', choices=['No', 'Yes'])
+    answer = dlg.show()
+    return bool(dlg.OK and answer and answer[0] == 'Yes')
+
+
+def profile_line(profile):
+    return (f"Timing profile ({profile.get('source', 'measured')} {profile['measured']}): "
+            f"{profile['frame_rate'] or 0:.2f} Hz / interval sd {profile['interval_sd'] * 1000:.2f} ms / "
+            f"{profile['dropped']} of {profile['flips']} refreshes dropped; flip latency max "
+            f"{profile['max_flip_latency'] * 1000:.2f} ms; text draw {profile['text_draw'] * 1000:.2f} ms / "
+            f"image draw {profile['image_draw'] * 1000:.3f} ms")
+
+
+if __name__ == '__main__':
+    from psychopy import visual
+
+    parser = argparse.ArgumentParser(description='Measure (again) the timing profile of this station.')
+    parser.add_argument('--fullscr', action='store_true', help='calibrate a full-screen window')
+    args = parser.parse_args()
+
+    win = visual.Window(fullscr=args.fullscr, color='white', units='pix')
+    profile = measure(win)
+    path = profile_path(win)
+    save_profile(profile, path)
+    frames = {name: max(1, int(round(seconds * (profile['frame_rate'] or 0)))) for name, seconds in SCHEDULE.items()}
+    problems, warnings = check(profile, frames)
+    win.close()
+
+    print(profile_line(profile))
+    for line in problems:
+        print('PROBLEM', line)
+    for line in warnings:
+        print('WARNING', line)
+    print(f'Saved {path}')
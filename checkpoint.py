@@ -0,0 +1,82 @@
+# Session checkpoint for crash recovery.
+# A small JSON file that holds the position of the running session: the next trial, the last
+# word shown, the block, the sha256 of the randomized list and the clock offsets (monotonic and
+# wall time of the last update). update() only changes the in-memory state. A background thread
+# rewrites the file atomically (temporary file, fsync, rename), so there is never a half-written
+# checkpoint on disk and nothing waits on the disk while frames are being drawn. Resuming
+# is a single small read. It does not depend on parsing logs that may be half-written.
+# A failed write is kept and raised from close(); later updates are still written.
+
+import hashlib
+import json
+import os
+import threading
+import time
+
+
+def file_hash(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 16), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def load_checkpoint(path):
+    # The last checkpoint written, or None if there is none
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+class Checkpoint:
+    def __init__(self, path, clock, **state):
+        self.path = path
+        self._clock = clock
+        self.state = dict(state, mono=clock(), wall=time.time())
+
+        self._lock = threading.Lock()
+        self._changed = threading.Event()
+        self._closed = False
+        self._error = None
+        self._write(self.state)
+        self._thread = threading.Thread(target=self._run, name=f'Checkpoint({os.path.basename(path)})',
+                                        daemon=True)
+        self._thread.start()
+
+    def update(self, **fields):
+        with self._lock:
+            self.state.update(fields, mono=self._clock(), wall=time.time())
+        self._changed.set()
+
+    def close(self):
+        # Write the last state and stop the writer thread
+        self._closed = True
+        self._changed.set()
+        self._thread.join()
+        if self._error is not None:
+            raise self._error
+
+    def _write(self, state):
+        tmp_path = self.path + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(state, f, indent=1)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.path)
+
+    def _run(self):
+        while True:
+            self._changed.wait()
+            self._changed.clear()
+            closed = self._closed
+            with self._lock:
+                state = dict(self.state)
+            try:
+                self._write(state)
+            except OSError as error:
+                self._error = self._error or error
+            if closed:
+                return
@@ -0,0 +1,170 @@
+# Clock alignment between PsychoPy time, the wall clock and the EEG recording.
+# Events are logged with the monotonic PsychoPy clock only. During a session ClockSync reads
+# the monotonic clock and the wall clock together once a second on a background thread (the
+# pair with the shortest bracket of three reads) and writes each pair to the journal as a
+# CLOCK record. fit_clock() fits wall = slope * time + intercept over those samples, which
+# gives every event its wall-clock time without a time.time() call per event.
+#
+# Between trials ClockSync also sends the scheme's 'sync' trigger code about once a minute.
+# The EEG recording has those codes at known sample indices, so after the session
+#   python clocksync.py logs_experiment/P01_journal.bin P01_markers.csv
+# matches the logged sync triggers to the recorded ones, fits sample = slope * time +
+# intercept and writes every journal event with its session time, wall-clock time and EEG
+# sample (P01_journal_aligned.csv). The markers CSV needs 'sample' and 'code' columns, as
+# exported from the recording software.
+
+import argparse
+import os
+import threading
+import time
+import journal
+
+
+def _pair(clock, wall_clock, reads=3):
+    # (monotonic, wall) read as close together as possible
+    best = None
+    for _ in range(reads):
+        before = clock()
+        wall = wall_clock()
+        after = clock()
+        if best is None or after - before < best[0]:
+            best = (after - before, (before + after) / 2, wall)
+    return best[1], best[2]
+
+
+def fit_clock(times, walls):
+    # (slope, intercept) of wall = slope * time + intercept; None without samples (a journal cut
+    # off before its first CLOCK record was written)
+    import numpy as np
+
+    if not times:
+        return None
+    if len(set(times)) == 1:
+        return 1.0, walls[0] - times[0]
+    # Relative to the first sample: wall-clock times are too large for a well-conditioned fit
+    t0, wall0 = times[0], walls[0]
+    slope, intercept = np.polyfit(np.asarray(times) - t0, np.asarray(walls) - wall0, 1)
+    return float(slope), float(intercept + wall0 - slope * t0)
+
+
+class ClockSync:
+    def __init__(self, clock, sink=None, triggers=None, sync_code=200, interval=1.0, sync_every=60.0,
+                 wall_clock=time.time):
+        self._clock = clock
+        self._wall_clock = wall_clock
+        self.sink = sink  # EventJournal
+        self.triggers = triggers
+        self.sync_code = sync_code
+        self.interval = interval
+        self.sync_every = sync_every
+
+        self.times = []  # monotonic time of each sample
+        self.walls = []  # wall-clock time of each sample
+        self._last_sync = clock()
+        self._stop = threading.Event()
+        self.sample()
+        self._thread = threading.Thread(target=self._run, name='ClockSync', daemon=True)
+        self._thread.start()
+
+    def sample(self):
+        t, wall = _pair(self._clock, self._wall_clock)
+        self.times.append(t)
+        self.walls.append(wall)
+        if self.sink is not None:
+            self.sink.record(journal.CLOCK, t, wall=wall)
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self.sample()
+
+    def maybe_sync(self):
+        # Called between trials: arms the sync code for the next flip once sync_every has passed
+        if self.triggers is not None and self._clock() - self._last_sync >= self.sync_every:
+            self.triggers.arm(self.sync_code)
+            self._last_sync = self._clock()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+        self.sample()
+
+    def fit(self):
+        return fit_clock(self.times, self.walls)
+
+
+# --- After the session: journal time to EEG samples ---
+def match_sync(log_times, eeg_samples, min_pairs=3):
+    # Pairs the logged sync triggers with the recorded ones. The recording may have started
+    # late or stopped early, so the shorter sequence is tried at every position in the longer
+    # one and the position whose linear fit leaves the smallest residual wins.
+    import numpy as np
+
+    log_times, eeg_samples = np.asarray(log_times, float), np.asarray(eeg_samples, float)
+    n = min(len(log_times), len(eeg_samples))
+    if n < min_pairs:
+        raise ValueError(f'Need at least {min_pairs} sync triggers in both the log and the recording')
+
+    best = None
+    for log_shift in range(len(log_times) - n + 1):
+        for eeg_shift in range(len(eeg_samples) - n + 1):
+            times, samples = log_times[log_shift:log_shift + n], eeg_samples[eeg_shift:eeg_shift + n]
+            slope, intercept = np.polyfit(times, samples, 1)
+            residual = np.abs(samples - (slope * times + intercept)).max()
+            if best is None or residual < best[0]:
+                best = (residual, slope, intercept)
+    residual, slope, intercept = best
+    return slope, intercept, residual, n
+
+
+def align_journal(journal_path, eeg_samples, eeg_codes, sync_code=200):
+    # Every journal event with its session time, wall-clock time and EEG sample, as columns
+    import numpy as np
+
+    records = journal.read_journal_array(journal_path)
+    clock = records[records['kind'] == journal.CLOCK]
+    wall_fit = fit_clock(clock['time'].tolist(), clock['wall'].tolist())
+    walls = np.full(len(records), np.nan) if wall_fit is None else wall_fit[0] * records['time'] + wall_fit[1]
+
+    sync = records[(records['kind'] == journal.TRIGGER) & (records['code'] == sync_code)]
+    eeg_samples, eeg_codes = np.asarray(eeg_samples), np.asarray(eeg_codes)
+    slope, intercept, residual, pairs = match_sync(sync['time'], eeg_samples[eeg_codes == sync_code])
+
+    events = records[records['kind'] != journal.CLOCK]
+    starts = events['time'][events['kind'] == journal.SESSION_START]
+    start = starts[0] if len(starts) else events['time'][0]
+    columns = {
+        'kind': events['kind'],
+        'trial': events['trial'],
+        'word': events['word'],
+        'code': events['code'],
+        'time': events['time'] - start,
+        'wall': walls[records['kind'] != journal.CLOCK],
+        'eeg_sample': np.rint(slope * events['time'] + intercept).astype(np.int64),
+    }
+    fit = {'slope': slope, 'intercept': intercept, 'max_residual': residual, 'sync_pairs': pairs}
+    return columns, fit
+
+
+if __name__ == '__main__':
+    import csv
+
+    parser = argparse.ArgumentParser(description='Align a session journal with an EEG recording.')
+    parser.add_argument('journal', help='{id}_journal.bin')
+    parser.add_argument('markers', help="CSV of the recording's markers with 'sample' and 'code' columns")
+    parser.add_argument('--sync-code', type=int, default=200)
+    args = parser.parse_args()
+
+    with open(args.markers, encoding='utf-8-sig', newline='') as f:
+        markers = list(csv.DictReader(f))
+    columns, fit = align_journal(args.journal, [int(m['sample']) for m in markers],
+                                 [int(m['code']) for m in markers], args.sync_code)
+
+    out_path = os.path.splitext(args.journal)[0] + '_aligned.csv'
+    with open(out_path, 'w', newline='', encoding='utf-8') as f:
+        writer = csv.writer(f)
+        writer.writerow([f"# {fit['sync_pairs']} sync triggers; {fit['slope']:.6f} samples/s; "
+                         f"max residual {fit['max_residual']:.2f} samples"])
+        writer.writerow(list(columns))
+        writer.writerows(zip(*(column.tolist() for column in columns.values())))
+    print(f"Aligned on {fit['sync_pairs']} sync triggers (max residual {fit['max_residual']:.2f} "
+          f"samples). Saved {out_path}")
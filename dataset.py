@@ -0,0 +1,354 @@
+# Columnar dataset over all sessions.
+# Scans logs_experiment/ and logs_order/ and writes three tables with one file per participant:
+#   dataset/trials/{id}.parquet    one row per completed trial (sentence or question)
+#   dataset/words/{id}.parquet     one row per word shown
+#   dataset/sessions/{id}.parquet  one row per session: length, pauses, breaks, frame timing
+# Trials and words are joined with the participant's randomized list (condition, codes, target
+# word). Times are seconds from the start of the session the row was recorded in, durations in
+# the sessions table are seconds, frame timing (from the timing summary) milliseconds.
+#
+# A participant's original session and its resumed ones ('_postcrash', '_postcrash2', ...) are
+# merged as segments 0, 1, 2, ...: a trial interrupted by a crash and run again after resuming
+# is taken from the last session that completed it, words included. Sessions with an event journal are read from it (exact times,
+# no text parsing); older ones from their data and word CSVs.
+#
+# dataset/manifest.json records size and mtime of every source file, so an update only reads
+# participants that are new or whose logs changed, in parallel worker processes (a participant
+# per task, like randomizer.randomize_batch). Parquet needs pyarrow or fastparquet;
+# without them the tables are written as pandas pickles (.pkl). load_dataset() returns one
+# table over all participants either way.
+#
+#   python dataset.py             update dataset/
+#   python dataset.py --rebuild   read every participant again
+
+import argparse
+import json
+import os
+import re
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+import journal
+
+DATASET_VERSION = 2
+SEGMENT_FILE = re.compile(r'(.+)_(?:journal(?:_postcrash\d*)?\.bin|data(?:_postcrash\d*)?\.csv)$')
+TABLES = ['trials', 'words', 'sessions']
+
+TRIAL_COLUMNS = ['participant', 'segment', 'trial_num', 'sentence_id', 'condition', 'condition_code',
+                 'is_question', 'correct_answer', 'response', 'rt', 'onset']
+WORD_COLUMNS = ['participant', 'segment', 'trial_num', 'sentence_id', 'condition', 'condition_code',
+                'word_pos', 'word', 'is_target', 'onset']
+TIMING_COLUMNS = ['late_onsets', 'dropped_frames', 'max_onset_error', 'max_trigger_delay',
+                  'missing_triggers', 'mean_frame_interval', 'sd_frame_interval', 'max_frame_interval']
+SESSION_COLUMNS = ['participant', 'segment', 'source', 'first_space', 'duration', 'trials', 'pauses',
+                   'pause_time', 'breaks', 'break_time'] + TIMING_COLUMNS
+COLUMNS = {'trials': TRIAL_COLUMNS, 'words': WORD_COLUMNS, 'sessions': SESSION_COLUMNS}
+
+# Session events kept for the sessions table, by journal event type
+_SESSION_EVENTS = {
+    journal.SESSION_START: 'SESSION_START',
+    journal.SESSION_END: 'SESSION_END',
+    journal.PAUSE_START: 'PAUSE_START',
+    journal.PAUSE_RESUME: 'PAUSE_RESUME',
+    journal.BREAK_START: 'BREAK_START',
+    journal.BREAK_END: 'BREAK_END',
+}
+
+
+def _table_format():
+    for engine in ('pyarrow', 'fastparquet'):
+        try:
+            __import__(engine)
+            return 'parquet'
+        except ImportError:
+            pass
+    return 'pkl'
+
+
+def find_participants(logs_dir):
+    ids = set()
+    for filename in os.listdir(logs_dir):
+        match = SEGMENT_FILE.match(filename)
+        if match:
+            ids.add(match.group(1))
+    return sorted(ids)
+
+
+def _segment_postfixes(pid, logs_dir):
+    # File postfix of each of the participant's segments, in order (see journal.segment_postfix)
+    segments = journal.next_segment(os.path.join(logs_dir, f'{pid}_journal.bin'),
+                                    os.path.join(logs_dir, f'{pid}_data.csv'))
+    return [journal.segment_postfix(segment) for segment in range(segments)]
+
+
+def _sources(pid, logs_dir, lists_dir):
+    # {path: [size, mtime_ns]} of every file the participant's tables are built from
+    paths = [os.path.join(lists_dir, f'{pid}_randomized_list.csv')]
+    for postfix in _segment_postfixes(pid, logs_dir):
+        paths += [os.path.join(logs_dir, f'{pid}_{name}{postfix}.{ext}')
+                  for name, ext in (('journal', 'bin'), ('data', 'csv'), ('word_log', 'csv'),
+                                    ('timing_summary', 'csv'))]
+    sources = {}
+    for path in paths:
+        if os.path.exists(path):
+            stat = os.stat(path)
+            sources[path] = [stat.st_size, stat.st_mtime_ns]
+    return sources
+
+
+# --- Reading one session ---
+def _journal_segment(path):
+    records = journal.read_journal_array(path)
+    session_start = records['time'][records['kind'] == journal.SESSION_START]
+    start = session_start[0] if len(session_start) else (records['time'][0] if len(records) else 0.0)
+
+    done = records[records['kind'] == journal.TRIAL]
+    answered = done['value'] > 0
+    trials = pd.DataFrame({
+        'trial_num': done['trial'] + 1,
+        'response': [chr(value) if value else '' for value in done['value']],
+        'rt': np.where(answered, done['aux'].astype('f8').round(4), np.nan),
+        'onset': done['time'] - start,
+    })
+
+    shown = records[records['kind'] == journal.WORD]
+    words = pd.DataFrame({
+        'trial_num': shown['trial'] + 1,
+        'word_pos': shown['word'] + 1,
+        'onset': shown['time'] - start,
+    })
+
+    marked = records[np.isin(records['kind'], list(_SESSION_EVENTS))]
+    events = pd.DataFrame({
+        'event': [_SESSION_EVENTS[kind] for kind in marked['kind']],
+        'time': marked['time'] - start,
+        'aux': marked['aux'].astype('f8'),
+    })
+    if not (events['event'] == 'SESSION_END').any() and len(records):
+        # Crashed without a SESSION_END: the session ran until its last record
+        events.loc[len(events)] = ['SESSION_END', records['time'][-1] - start, 0.0]
+    return trials, words, events
+
+
+def _seconds(event_times):
+    return pd.to_timedelta(event_times).dt.total_seconds()
+
+
+def _csv_segment(data_path, word_path):
+    # Trials from the data log, words from the word log, session events from the data log's
+    # '#' lines (first SPACE, duration) and PAUSE/BREAK marker rows
+    data = pd.read_csv(data_path, comment='#', dtype=str, keep_default_na=False, encoding='utf-8')
+    markers = data[data['trial_num'] == '']
+    data = data[data['trial_num'] != '']
+    trials = pd.DataFrame({
+        'trial_num': data['trial_num'].astype(int),
+        'response': data['response'],
+        'rt': pd.to_numeric(data['rt'], errors='coerce') if 'rt' in data else np.nan,
+        'onset': _seconds(data['event_time']),
+    })
+
+    words = pd.DataFrame(columns=['trial_num', 'word_pos', 'onset'])
+    if os.path.exists(word_path):
+        log = pd.read_csv(word_path, dtype=str, keep_default_na=False, encoding='utf-8')
+        log = log[log['trial_num'] != '']
+        words = pd.DataFrame({'trial_num': log['trial_num'].astype(int), 'onset': _seconds(log['event_time'])})
+        words['word_pos'] = words.groupby('trial_num').cumcount() + 1
+
+    events = pd.DataFrame({
+        'event': markers['sentence_id'].str.replace(r'_block\d+$', '', regex=True),
+        'time': _seconds(markers['event_time']),
+        'aux': 0.0,
+    })
+    with open(data_path, encoding='utf-8') as f:
+        comments = [line.strip().strip('"') for line in f if line.lstrip('"').startswith('#')]
+    for line in comments:
+        label, _, value = line[2:].partition(': ')
+        if label == 'First SPACE pressed at':
+            events.loc[len(events)] = ['SESSION_START', 0.0, pd.to_timedelta(value).total_seconds()]
+        elif label == 'Experiment duration':
+            events.loc[len(events)] = ['SESSION_END', pd.to_timedelta(value).total_seconds(), 0.0]
+    return trials.reset_index(drop=True), words.reset_index(drop=True), events
+
+
+def _paired_time(events, start, end):
+    # Number of start events and the total time until the end event following each
+    starts = events.loc[events['event'] == start, 'time'].to_numpy()
+    ends = np.sort(events.loc[events['event'] == end, 'time'].to_numpy())
+    following = np.searchsorted(ends, starts)
+    closed = following < len(ends)
+    return len(starts), float((ends[following[closed]] - starts[closed]).sum())
+
+
+def _session_row(segment, source, trials, events, timing_path):
+    session_start = events.loc[events['event'] == 'SESSION_START', 'aux']
+    session_end = events.loc[events['event'] == 'SESSION_END', 'time']
+    pauses, pause_time = _paired_time(events, 'PAUSE_START', 'PAUSE_RESUME')
+    breaks, break_time = _paired_time(events, 'BREAK_START', 'BREAK_END')
+    row = {
+        'segment': segment,
+        'source': source,
+        'first_space': session_start.iloc[0] if len(session_start) else np.nan,
+        'duration': session_end.iloc[-1] if len(session_end) else np.nan,
+        'trials': len(trials),
+        'pauses': pauses,
+        'pause_time': pause_time,
+        'breaks': breaks,
+        'break_time': break_time,
+    }
+    row.update(dict.fromkeys(TIMING_COLUMNS, np.nan))
+    if os.path.exists(timing_path) and os.path.getsize(timing_path):  # empty if killed while writing it
+        summary = pd.read_csv(timing_path, encoding='utf-8')
+        session = summary[summary['level'] == 'session']
+        if len(session):
+            row.update(session.iloc[0][TIMING_COLUMNS].astype(float).to_dict())
+    return row
+
+
+# --- One participant ---
+def _merge_segments(segments):
+    # segments: {segment: (trials, words)}. Each trial from the last segment that completed it;
+    # its words from that segment too, or from the last one that showed them if none did.
+    trials = pd.concat([t.assign(segment=s) for s, (t, _) in segments.items()], ignore_index=True)
+    trials = trials.sort_values('segment', kind='stable').drop_duplicates('trial_num', keep='last')
+
+    words = pd.concat([w.assign(segment=s) for s, (_, w) in segments.items()], ignore_index=True)
+    owner = words.groupby('trial_num')['segment'].max()
+    owner.update(trials.set_index('trial_num')['segment'])
+    words = words[words['segment'].to_numpy() == words['trial_num'].map(owner).to_numpy()]
+
+    return (trials.sort_values('trial_num', kind='stable').reset_index(drop=True),
+            words.sort_values(['trial_num', 'word_pos'], kind='stable').reset_index(drop=True))
+
+
+def build_participant(pid, logs_dir='logs_experiment', lists_dir='logs_order'):
+    trial_list = pd.read_csv(os.path.join(lists_dir, f'{pid}_randomized_list.csv'), dtype=str,
+                             keep_default_na=False, encoding='utf-8-sig')
+    trial_list['trial_num'] = np.arange(1, len(trial_list) + 1)
+    trial_list['condition_code'] = pd.to_numeric(trial_list['condition_code'], errors='coerce')
+    trial_list['target_word'] = pd.to_numeric(trial_list['target_word'], errors='coerce')
+    trial_list['is_question'] = trial_list['id'].str.startswith('Q_')
+    trial_list = trial_list.rename(columns={'id': 'sentence_id'})
+
+    segments, sessions = {}, []
+    for segment, postfix in enumerate(_segment_postfixes(pid, logs_dir)):
+        journal_path = os.path.join(logs_dir, f'{pid}_journal{postfix}.bin')
+        data_path = os.path.join(logs_dir, f'{pid}_data{postfix}.csv')
+        if os.path.exists(journal_path):
+            source = 'journal'
+            seg_trials, seg_words, events = _journal_segment(journal_path)
+        elif os.path.exists(data_path):
+            source = 'csv'
+            seg_trials, seg_words, events = _csv_segment(
+                data_path, os.path.join(logs_dir, f'{pid}_word_log{postfix}.csv'))
+        else:
+            continue
+        segments[segment] = seg_trials, seg_words
+        sessions.append(_session_row(segment, source, seg_trials, events,
+                                     os.path.join(logs_dir, f'{pid}_timing_summary{postfix}.csv')))
+    trials, words = _merge_segments(segments)
+    sessions = pd.DataFrame(sessions).assign(participant=pid)
+
+    info = trial_list[['trial_num', 'sentence_id', 'condition', 'condition_code', 'is_question',
+                       'correct_answer']]
+    trials = trials.merge(info, on='trial_num', how='left').assign(participant=pid)
+
+    # Every word of every listed sentence with its 1-based position, for the word text
+    list_words = trial_list[['trial_num', 'sentence_id', 'condition', 'condition_code', 'target_word']].assign(
+        word=trial_list['sentence'].str.split()).explode('word')
+    list_words['word_pos'] = list_words.groupby('trial_num').cumcount() + 1
+    words = words.merge(list_words, on=['trial_num', 'word_pos'], how='left').assign(participant=pid)
+    words['is_target'] = words['word_pos'] == words['target_word']
+    return trials[TRIAL_COLUMNS], words[WORD_COLUMNS], sessions[SESSION_COLUMNS]
+
+
+# --- Dataset ---
+def _write_table(table, path):
+    tmp_path = path + '.tmp'
+    if path.endswith('.parquet'):
+        table.to_parquet(tmp_path, index=False)
+    else:
+        table.to_pickle(tmp_path, compression=None)
+    os.replace(tmp_path, path)
+
+
+def _build_job(job):
+    pid, logs_dir, lists_dir, out_dir, table_format = job
+    for table, rows in zip(TABLES, build_participant(pid, logs_dir, lists_dir)):
+        _write_table(rows, os.path.join(out_dir, table, f'{pid}.{table_format}'))
+    return pid
+
+
+def build_dataset(logs_dir='logs_experiment', lists_dir='logs_order', out_dir='dataset', rebuild=False,
+                  workers=None, verbose=True):
+    # Returns the ids of the participants that were (re)built
+    table_format = _table_format()
+    manifest_path = os.path.join(out_dir, 'manifest.json')
+    manifest = {}
+    if not rebuild and os.path.exists(manifest_path):
+        with open(manifest_path, encoding='utf-8') as f:
+            manifest = json.load(f)
+    if manifest.get('version') != DATASET_VERSION or manifest.get('format') != table_format:
+        manifest = {}
+    participants = manifest.setdefault('participants', {})
+    manifest.update(version=DATASET_VERSION, format=table_format)
+
+    for table in TABLES:
+        os.makedirs(os.path.join(out_dir, table), exist_ok=True)
+
+    changed = {}
+    for pid in find_participants(logs_dir):
+        sources = _sources(pid, logs_dir, lists_dir)
+        if not os.path.join(lists_dir, f'{pid}_randomized_list.csv') in sources:
+            if verbose:
+                print(f'{pid}: no randomized list in {lists_dir}, skipped')
+            continue
+        if participants.get(pid) != sources:
+            changed[pid] = sources
+
+    jobs = [(pid, logs_dir, lists_dir, out_dir, table_format) for pid in changed]
+    built = []
+    if len(jobs) > 1 and workers != 1:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            built = list(pool.map(_build_job, jobs))
+    else:
+        built = [_build_job(job) for job in jobs]
+    for pid in built:
+        participants[pid] = changed[pid]
+        if verbose:
+            print(f'{pid}: {len(changed[pid])} source files')
+
+    tmp_path = manifest_path + '.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, indent=1)
+    os.replace(tmp_path, manifest_path)
+    return built
+
+
+def load_dataset(table='trials', out_dir='dataset', participants=None):
+    folder = os.path.join(out_dir, table)
+    parts = []
+    for filename in sorted(os.listdir(folder)):
+        pid, ext = os.path.splitext(filename)
+        if participants is not None and pid not in participants:
+            continue
+        path = os.path.join(folder, filename)
+        if ext == '.parquet':
+            parts.append(pd.read_parquet(path))
+        elif ext == '.pkl':
+            parts.append(pd.read_pickle(path, compression=None))
+    return pd.concat(parts, ignore_index=True) if parts else pd.DataFrame(columns=COLUMNS[table])
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Build or update the columnar dataset of all sessions.')
+    parser.add_argument('--logs', default='logs_experiment', help='folder with the session logs')
+    parser.add_argument('--lists', default='logs_order', help='folder with the randomized lists')
+    parser.add_argument('--out', default='dataset', help='dataset folder')
+    parser.add_argument('--rebuild', action='store_true', help='read every participant again')
+    parser.add_argument('--workers', type=int, default=None, help='worker processes (default: CPU count)')
+    args = parser.parse_args()
+
+    built = build_dataset(args.logs, args.lists, args.out, args.rebuild, args.workers)
+    print(f'{len(built)} participant(s) updated in {args.out}/ ({_table_format()} tables)')
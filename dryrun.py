@@ -0,0 +1,311 @@
+# Headless dry run.
+# With --dry-run on their command line the experiment scripts call install() before importing
+# psychopy: psychopy.core, visual, event, hardware.keyboard, gui, logging and parallel are
+# replaced by the stand-ins below, and nothing else in the scripts changes. Time is virtual and
+# only moves when the scripts flip, wait or poll keys, so a whole session runs in seconds and
+# writes the same log files as a real one.
+#
+# - Window.flip() advances the clock to the next refresh at --frame-rate; --drop-rate makes a
+#   flip miss a refresh now and then.
+# - Keys given with --keys (virtual seconds from startup, e.g. 120:escape,125:space) arrive at
+#   those times. waitKeys() and keyboard waits without a matching scripted key get SPACE after
+#   --wait seconds, and a screen that has not been flipped for --answer-after seconds (a
+#   question) is answered with a random N/O key.
+# - The participant dialog gets --participant, a resume dialog is answered with --resume.
+#
+#   python Experiment_trig_Elena.py --dry-run --participant DRY01 --keys 300:escape,302:space
+
+import argparse
+import atexit
+import random
+import sys
+import time
+import types
+
+POLL_TIME = 0.0005  # virtual seconds each getKeys() call takes
+
+
+class _Session:
+    def __init__(self, args):
+        self.args = args
+        self.rng = random.Random(args.seed)
+        self.time = 0.0
+        self.last_flip = 0.0
+        self.flips = 0
+        self.port_writes = 0
+        self.keys = []
+        for item in filter(None, args.keys.split(',')):
+            at, key = item.split(':')
+            self.keys.append((float(at), key))
+        self.keys.sort()
+        self.started = time.perf_counter()
+
+    def advance(self, seconds):
+        if seconds > 0:
+            self.time += seconds
+
+    def poll(self, keyList):
+        # Scripted keys pressed by now. Without one, a question that has been up for
+        # --answer-after seconds is answered and any other wait gets SPACE after --wait seconds.
+        self.advance(POLL_TIME)
+        keys = []
+        while self.keys and self.keys[0][0] <= self.time:
+            _, key = self.keys.pop(0)
+            if keyList is None or key in keyList:
+                keys.append(key)
+        if keys:
+            return keys
+
+        shown_for = self.time - self.last_flip
+        if keyList is None or 'n' in keyList:
+            if shown_for >= self.args.answer_after:
+                keys = [self.rng.choice(['n', 'o'])]
+        elif shown_for >= self.args.wait and not (self.keys and self.keys[0][1] in keyList):
+            keys = ['space' if 'space' in keyList else keyList[0]]
+        return keys
+
+    def report(self):
+        elapsed = time.perf_counter() - self.started
+        per_flip = elapsed / self.flips * 1e6 if self.flips else 0.0
+        print(f'Dry run: {self.time:.1f} s of session time in {elapsed:.2f} s, {self.flips} flips '
+              f'({per_flip:.1f} us of loop overhead per flip), {self.port_writes} port writes')
+
+
+def _core(session):
+    module = types.ModuleType('psychopy.core')
+
+    def getTime():
+        return session.time
+
+    def wait(seconds, hogCPUperiod=0.2):
+        session.advance(seconds)
+
+    def quit():
+        raise SystemExit(0)
+
+    class Clock:
+        def __init__(self):
+            self._start = session.time
+
+        def getTime(self):
+            return session.time - self._start
+
+        def reset(self, newT=0.0):
+            self._start = session.time - newT
+
+    module.getTime = getTime
+    module.wait = wait
+    module.quit = quit
+    module.rush = lambda enable=True, realtime=False: True
+    module.Clock = Clock
+    module.MonotonicClock = Clock
+    module.monotonicClock = Clock()
+    return module
+
+
+def _visual(session):
+    module = types.ModuleType('psychopy.visual')
+    frame_duration = 1.0 / session.args.frame_rate
+
+    class Window:
+        def __init__(self, size=(800, 600), color=(0, 0, 0), *args, **kwargs):
+            self.size = size
+            self.color = color
+            self.movieFrames = []
+            self._on_flip = []
+
+        def getActualFrameRate(self, *args, **kwargs):
+            return session.args.frame_rate
+
+        def callOnFlip(self, function, *args, **kwargs):
+            self._on_flip.append((function, args, kwargs))
+
+        def flip(self, clearBuffer=True):
+            refresh = int(session.time / frame_duration + 1e-9) + 1
+            if session.rng.random() < session.args.drop_rate:
+                refresh += 1
+            session.time = refresh * frame_duration
+            session.last_flip = session.time
+            session.flips += 1
+
+            on_flip, self._on_flip = self._on_flip, []
+            for function, args, kwargs in on_flip:
+                function(*args, **kwargs)
+            return session.time
+
+        def clearBuffer(self, color=True, depth=False, stencil=False):
+            pass
+
+        def getMovieFrame(self, buffer='front'):
+            from PIL import Image  # Only for word textures that are not cached yet
+            frame = Image.new('RGB', self.size, 'white')
+            self.movieFrames.append(frame)
+            return frame
+
+        def close(self):
+            pass
+
+    class TextStim:
+        def __init__(self, win, text='', **kwargs):
+            self.win = win
+            self.text = text
+            self.__dict__.update(kwargs)
+
+        def setText(self, text):
+            self.text = text
+
+        @property
+        def boundingBox(self):
+            height = getattr(self, 'height', 30)
+            return len(self.text) * height // 2, height
+
+        def draw(self, win=None):
+            pass
+
+    class ImageStim(TextStim):
+        def __init__(self, win, image=None, **kwargs):
+            super().__init__(win, **kwargs)
+            self.image = image
+
+    module.Window = Window
+    module.TextStim = TextStim
+    module.ImageStim = ImageStim
+    return module
+
+
+def _event(session):
+    module = types.ModuleType('psychopy.event')
+
+    def getKeys(keyList=None, timeStamped=False):
+        keys = session.poll(keyList)
+        if timeStamped:
+            return [(key, session.time) for key in keys]
+        return keys
+
+    def waitKeys(maxWait=float('inf'), keyList=None, timeStamped=False, **kwargs):
+        if session.keys and (keyList is None or session.keys[0][1] in keyList):
+            at, key = session.keys.pop(0)
+            session.time = max(session.time, at)
+        else:
+            session.advance(session.args.wait)
+            key = keyList[0] if keyList else 'space'
+        if timeStamped:
+            return [(key, session.time)]
+        return [key]
+
+    module.getKeys = getKeys
+    module.waitKeys = waitKeys
+    module.clearEvents = lambda eventType=None: None
+    return module
+
+
+def _keyboard(session):
+    module = types.ModuleType('psychopy.hardware.keyboard')
+    clock_type = sys.modules['psychopy.core'].Clock
+
+    class KeyPress:
+        def __init__(self, name, tDown, rt):
+            self.name = name
+            self.tDown = tDown
+            self.rt = rt
+            self.duration = None
+
+    class Keyboard:
+        def __init__(self, *args, **kwargs):
+            self.clock = clock_type()
+
+        def getKeys(self, keyList=None, waitRelease=False, clear=True):
+            return [KeyPress(key, session.time, self.clock.getTime()) for key in session.poll(keyList)]
+
+        def clearEvents(self, eventType=None):
+            pass
+
+    module.Keyboard = Keyboard
+    module.KeyPress = KeyPress
+    return module
+
+
+def _gui(session):
+    module = types.ModuleType('psychopy.gui')
+
+    class DlgFromDict:
+        def __init__(self, dictionary, title='', **kwargs):
+            dictionary['Participant ID'] = session.args.participant
+            self.OK = True
+
+    class Dlg:
+        def __init__(self, title='', **kwargs):
+            self.title = title
+            self.OK = True
+
+        def addText(self, text, **kwargs):
+            print(f'[{self.title}] {text}')
+
+        def addField(self, label, initial='', choices=None, **kwargs):
+            pass
+
+        def show(self):
+            print(f'[{self.title}] -> {session.args.resume}')
+            return [session.args.resume]
+
+    module.DlgFromDict = DlgFromDict
+    module.Dlg = Dlg
+    return module
+
+
+def _logging(session):
+    module = types.ModuleType('psychopy.logging')
+
+    def warning(message, t=None, obj=None):
+        print(f'WARNING {message}', file=sys.stderr)
+
+    module.warning = warning
+    module.error = warning
+    module.exp = module.info = module.data = module.debug = lambda message, t=None, obj=None: None
+    module.flush = lambda: None
+    return module
+
+
+def _parallel(session):
+    module = types.ModuleType('psychopy.parallel')
+
+    def setData(data):
+        session.port_writes += 1
+
+    module.setPortAddress = lambda address: None
+    module.setData = setData
+    return module
+
+
+def install(argv=None):
+    parser = argparse.ArgumentParser(description='Run the experiment headless with a virtual clock.')
+    parser.add_argument('--dry-run', action='store_true')
+    parser.add_argument('--participant', default='DRYRUN')
+    parser.add_argument('--resume', default='Yes', choices=['Yes', 'No'])
+    parser.add_argument('--keys', default='', help='scripted keys, time:key,time:key,...')
+    parser.add_argument('--frame-rate', type=float, default=60.0)
+    parser.add_argument('--drop-rate', type=float, default=0.0, help='probability that a flip misses a refresh')
+    parser.add_argument('--wait', type=float, default=1.0, help='seconds waitKeys() takes without a scripted key')
+    parser.add_argument('--answer-after', type=float, default=1.0, help='seconds before a question is answered')
+    parser.add_argument('--seed', type=int, default=0)
+    args, _ = parser.parse_known_args(argv)
+
+    session = _Session(args)
+    psychopy = types.ModuleType('psychopy')
+    psychopy.__path__ = []
+    sys.modules['psychopy'] = psychopy
+    for name, build in [('core', _core), ('visual', _visual), ('event', _event), ('gui', _gui),
+                        ('logging', _logging), ('parallel', _parallel)]:
+        module = build(session)
+        sys.modules[f'psychopy.{name}'] = module
+        setattr(psychopy, name, module)
+
+    hardware = types.ModuleType('psychopy.hardware')
+    hardware.__path__ = []
+    hardware.keyboard = _keyboard(session)
+    sys.modules['psychopy.hardware'] = hardware
+    sys.modules['psychopy.hardware.keyboard'] = hardware.keyboard
+    psychopy.hardware = hardware
+
+    atexit.register(session.report)
+    return session
@@ -0,0 +1,209 @@
+# Compact in-memory event store.
+# Every event of a session goes through EventStore.add(): the fields are appended to typed
+# array columns (about 40 bytes per event, no per-event dict or string) and the record is
+# passed on to the journal. Sentence ids are interned once in a small table. The CSV logs
+# are written from the trial_rows() / word_rows() / trigger_rows() views, so their layout
+# stays exactly what the analysis scripts expect. With a monitor set, every event is also
+# published to the live session monitor (see monitor.py).
+
+import csv
+import json
+import math
+from array import array
+from datetime import datetime, timedelta
+
+import journal
+from clocksync import fit_clock
+from journal import DATA_FIELDNAMES, WORD_FIELDNAMES
+
+_MARKERS = {
+    journal.PAUSE_START: 'PAUSE_START',
+    journal.PAUSE_RESUME: 'PAUSE_RESUME',
+    journal.RESUME_DETECTED: 'RESUME_DETECTED',
+    journal.BREAK_START: 'BREAK_START_block{}',
+    journal.BREAK_END: 'BREAK_END_block{}',
+}
+
+
+def format_event_time(t, start):
+    return str(timedelta(seconds=t - start))
+
+
+def format_real_time(wall, ms=True):
+    if math.isnan(wall):
+        return ''
+    if ms:
+        return datetime.fromtimestamp(wall).strftime('%H:%M:%S.%f')[:-3]
+    return datetime.fromtimestamp(wall).strftime('%H:%M:%S')
+
+
+class EventStore:
+    def __init__(self, sink=None):
+        self.sink = sink  # EventJournal (or None for a read-only store)
+        self.monitor = None  # MonitorStream
+
+        self.time = array('d')
+        self.trial = array('i')
+        self.code = array('H')
+        self.word = array('h')
+        self.kind = array('B')
+        self.value = array('B')
+        self.aux = array('f')
+        self.sentence = array('H')  # index into ids
+
+        self.ids = ['']
+        self._id_index = {'': 0}
+        self.wall_fit = None  # (slope, intercept) mapping time to wall clock (clocksync)
+
+    def __len__(self):
+        return len(self.kind)
+
+    def intern(self, sentence_id):
+        index = self._id_index.get(sentence_id)
+        if index is None:
+            index = self._id_index[sentence_id] = len(self.ids)
+            self.ids.append(sentence_id)
+        return index
+
+    def add(self, kind, t, trial=-1, word=-1, code=0, value=0, aux=0.0, sentence_id=''):
+        if self.sink is not None:
+            self.sink.record(kind, t, trial, word, code, value, aux)
+        if self.monitor is not None:
+            self.monitor.record(kind, t, trial, word, code, value, aux)
+        self._append(t, trial, code, word, kind, value, aux, self.intern(sentence_id))
+
+    def _append(self, t, trial, code, word, kind, value, aux, sentence):
+        self.time.append(t)
+        self.trial.append(trial)
+        self.code.append(code)
+        self.word.append(word)
+        self.kind.append(kind)
+        self.value.append(value)
+        self.aux.append(aux)
+        self.sentence.append(sentence)
+
+    def sync(self, wait=True):
+        # A failed journal write does not stop the session: the store still has every event and
+        # the CSV logs are written from it; the error is raised again by close()
+        if self.sink is not None:
+            try:
+                self.sink.sync(wait)
+            except OSError:
+                pass
+
+    def close(self):
+        if self.sink is not None:
+            self.sink.close()
+
+    @classmethod
+    def from_journal(cls, path, trials):
+        store = cls()
+        clock_times, clock_walls = [], []
+        for t, wall, trial, code, word, kind, value, aux in journal.read_journal(path):
+            if kind == journal.CLOCK:
+                clock_times.append(t)
+                clock_walls.append(wall)
+                continue
+            sentence_id = trials[trial]['id'] if trial >= 0 else ''
+            store._append(t, trial, code, word, kind, value, aux, store.intern(sentence_id))
+        store.wall_fit = fit_clock(clock_times, clock_walls)
+        return store
+
+    def wall_time(self, i):
+        if self.wall_fit is None:
+            return math.nan  # No CLOCK sample to take it from
+        slope, intercept = self.wall_fit
+        return slope * self.time[i] + intercept
+
+    # --- Views ---
+    def session_times(self):
+        # (experiment start, seconds to first SPACE, end of session)
+        start = first_space = end = None
+        for i, kind in enumerate(self.kind):
+            if kind == journal.SESSION_START and start is None:
+                start, first_space = self.time[i], self.aux[i]
+            elif kind == journal.SESSION_END:
+                end = self.time[i]
+        if start is None:
+            start, first_space = (self.time[0] if len(self) else 0.0), 0.0
+        if end is None:
+            end = self.time[-1] if len(self) else start
+        return start, first_space, end
+
+    def _marker(self, i, start):
+        return {
+            'sentence_id': _MARKERS[self.kind[i]].format(self.value[i]),
+            'event_time': format_event_time(self.time[i], start),
+            'real_time': format_real_time(self.wall_time(i)),
+        }
+
+    def trial_rows(self, trials):
+        start = self.session_times()[0]
+        for i, kind in enumerate(self.kind):
+            if kind == journal.TRIAL:
+                trial = self.trial[i]
+                row = trials[trial]
+                yield {
+                    'trial_num': trial + 1,
+                    'sentence_id': self.ids[self.sentence[i]],
+                    'sentence': row['sentence'],
+                    'question': row.get('question', ''),
+                    'correct_answer': row.get('correct_answer', ''),
+                    'response': chr(self.value[i]) if self.value[i] else '',
+                    'rt': round(self.aux[i], 4) if self.value[i] else '',
+                    'event_time': format_event_time(self.time[i], start),
+                    'real_time': format_real_time(self.wall_time(i), ms=False),
+                }
+            elif kind in _MARKERS:
+                yield self._marker(i, start)
+
+    def word_rows(self, trials):
+        start = self.session_times()[0]
+        for i, kind in enumerate(self.kind):
+            if kind == journal.WORD:
+                trial = self.trial[i]
+                yield {
+                    'trial_num': trial + 1,
+                    'sentence_id': self.ids[self.sentence[i]],
+                    'word': trials[trial]['sentence'].split()[self.word[i]],
+                    'event_time': format_event_time(self.time[i], start),
+                    'real_time': format_real_time(self.wall_time(i)),
+                }
+            elif kind in _MARKERS:
+                yield self._marker(i, start)
+
+    def trigger_rows(self):
+        start = self.session_times()[0]
+        for i, kind in enumerate(self.kind):
+            if kind == journal.TRIGGER:
+                yield {'code': self.code[i], 'event_time': format_event_time(self.time[i], start)}
+
+
+def write_session_info(path, **info):
+    # Session metadata (trigger write latency, ...) as JSON next to the CSV logs, so the layout
+    # of the data CSV stays the one the analysis scripts read
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(info, f, indent=1)
+
+
+def write_csv_logs(store, trials, data_path, word_path, trigger_path=None):
+    start, first_space, end = store.session_times()
+
+    with open(data_path, 'w', newline='', encoding='utf-8') as f:
+        raw_writer = csv.writer(f)
+        raw_writer.writerow([f'# First SPACE pressed at: {timedelta(seconds=first_space)}'])
+        raw_writer.writerow([f'# Experiment duration: {timedelta(seconds=end - start)}'])
+        writer = csv.DictWriter(f, fieldnames=DATA_FIELDNAMES, restval='')
+        writer.writeheader()
+        writer.writerows(store.trial_rows(trials))
+
+    with open(word_path, 'w', newline='', encoding='utf-8') as f:
+        writer = csv.DictWriter(f, fieldnames=WORD_FIELDNAMES, restval='')
+        writer.writeheader()
+        writer.writerows(store.word_rows(trials))
+
+    if trigger_path is not None:
+        with open(trigger_path, 'w', newline='', encoding='utf-8') as f:
+            writer = csv.DictWriter(f, fieldnames=['code', 'event_time'])
+            writer.writeheader()
+            writer.writerows(store.trigger_rows())
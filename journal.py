@@ -0,0 +1,151 @@
+# Append-only binary event journal.
+# The trial loop records plain numbers (monotonic time, trial/word index, trigger code, event
+# type) as fixed-width records; nothing is formatted while stimuli are on screen. Records are
+# written by the background writer and can be memory-mapped for reading. The _data.csv,
+# _word_log.csv and _trigger_log.csv layouts are produced by eventstore.write_csv_logs() at the
+# end of a session, or from the journal afterwards with export_csv() / the command line:
+#
+#   python journal.py logs_experiment/P01_journal.bin logs_order/P01_randomized_list.csv
+
+import argparse
+import csv
+import mmap
+import os
+import struct
+
+from logwriter import BackgroundWriter
+
+MAGIC = b'RSVPJRNL'
+VERSION = 1
+HEADER = struct.Struct('<8sHH4x')
+# time, wall clock, trial, trigger code, word, event type, value, aux (+2 bytes padding)
+RECORD = struct.Struct('<ddiHhBBf2x')
+
+# --- Event types ---
+SESSION_START = 1   # aux: seconds from instructions to the first SPACE press
+SESSION_END = 2
+TRIAL = 3           # value: response key (ord), 0 if none; aux: response time from question onset
+WORD = 4            # word: 0-based index into the sentence
+QUESTION = 5
+PAUSE_START = 6
+PAUSE_RESUME = 7
+BREAK_START = 8     # value: block number (1-based)
+BREAK_END = 9
+RESUME_DETECTED = 10
+TRIGGER = 11        # code: trigger code, time: when it was written to the port
+CLOCK = 12          # time and wall clock read together (clock alignment sample, see clocksync.py)
+
+# Response keys and the correct_answer values of the lists
+ANSWERS = {'n': 'ΝΑΙ', 'o': 'ΌΧΙ'}
+
+# rt is appended last so the baseline columns keep their positions for the analysis scripts
+DATA_FIELDNAMES = ['trial_num', 'sentence_id', 'sentence', 'question',
+                   'correct_answer', 'response', 'event_time', 'real_time', 'rt']
+WORD_FIELDNAMES = ['trial_num', 'sentence_id', 'word', 'event_time', 'real_time']
+
+
+class EventJournal(BackgroundWriter):
+    def __init__(self, path, batch_size=256):
+        super().__init__(path, 'wb', batch_size)
+        self._file.write(HEADER.pack(MAGIC, VERSION, RECORD.size))
+        self._start()
+
+    def record(self, kind, t, trial=-1, word=-1, code=0, value=0, aux=0.0, wall=0.0):
+        # Only CLOCK records carry a wall-clock time; the others get theirs from the CLOCK
+        # samples when the logs are written
+        self.append(RECORD.pack(t, wall, trial, code, word, kind, value, aux))
+
+    def _write_items(self, items):
+        self._file.write(b''.join(items))
+
+
+def read_journal(path):
+    # Returns the records as tuples in RECORD field order. A record torn by a crash is dropped.
+    with open(path, 'rb') as f:
+        size = os.fstat(f.fileno()).st_size
+        if size < HEADER.size:
+            return []
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as m:
+            magic, version, record_size = HEADER.unpack_from(m, 0)
+            if magic != MAGIC or record_size != RECORD.size:
+                raise ValueError(f'{path} is not a version {VERSION} event journal')
+            end = HEADER.size + (size - HEADER.size) // RECORD.size * RECORD.size
+            return list(RECORD.iter_unpack(m[HEADER.size:end]))
+
+
+def read_journal_array(path):
+    # The records as a numpy structured array (fields as in RECORD), for bulk analysis
+    import numpy as np
+
+    dtype = np.dtype([('time', '<f8'), ('wall', '<f8'), ('trial', '<i4'), ('code', '<u2'),
+                      ('word', '<i2'), ('kind', 'u1'), ('value', 'u1'), ('aux', '<f4'), ('pad', 'V2')])
+    with open(path, 'rb') as f:
+        data = f.read()
+    if len(data) < HEADER.size:
+        return np.zeros(0, dtype)
+    magic, version, record_size = HEADER.unpack_from(data, 0)
+    if magic != MAGIC or record_size != RECORD.size:
+        raise ValueError(f'{path} is not a version {VERSION} event journal')
+    count = (len(data) - HEADER.size) // RECORD.size  # A record torn by a crash is dropped
+    return np.frombuffer(data, dtype, count, HEADER.size)
+
+
+def completed_trials(path):
+    # Highest 1-based trial number with a TRIAL record, 0 if none
+    records = read_journal_array(path)
+    done = records['trial'][records['kind'] == TRIAL]
+    return int(done.max()) + 1 if len(done) else 0
+
+
+def completed_trials_csv(path):
+    # Highest trial_num in a _data.csv, for sessions recorded before journals and checkpoints;
+    # 0 if the file has no trial rows or cannot be read
+    try:
+        with open(path, 'r', encoding='utf-8', newline='') as f:
+            lines = list(csv.reader(f))
+        header_idx = next(i for i, row in enumerate(lines) if 'trial_num' in row)
+    except (OSError, UnicodeDecodeError, StopIteration):
+        return 0
+    return max((int(row[0]) for row in lines[header_idx + 1:] if row and row[0].isdigit()), default=0)
+
+
+def segment_postfix(segment):
+    # File postfix of a session segment: '' for the first run, then '_postcrash', '_postcrash2', ...
+    if segment == 0:
+        return ''
+    return '_postcrash' if segment == 1 else f'_postcrash{segment}'
+
+
+def next_segment(*paths):
+    # The first resumed segment none of paths (given without postfix) has a file for yet
+    segment = 1
+    while True:
+        postfix = segment_postfix(segment)
+        if not any(os.path.exists(postfix.join(os.path.splitext(path))) for path in paths):
+            return segment
+        segment += 1
+
+
+def read_trial_list(list_path):
+    with open(list_path, 'r', encoding='utf-8-sig', newline='') as f:
+        return list(csv.DictReader(f))
+
+
+def export_csv(journal_path, list_path, data_path, word_path, trigger_path=None):
+    from eventstore import EventStore, write_csv_logs
+
+    trials = read_trial_list(list_path)
+    store = EventStore.from_journal(journal_path, trials)
+    write_csv_logs(store, trials, data_path, word_path, trigger_path)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Export an event journal to the CSV log layouts.')
+    parser.add_argument('journal', help='{id}_journal.bin (or _journal_postcrash.bin, _journal_postcrash2.bin, ...)')
+    parser.add_argument('trial_list', help='randomized list the session was run with')
+    args = parser.parse_args()
+
+    base = args.journal.replace('_journal', '{}').replace('.bin', '.csv')
+    export_csv(args.journal, args.trial_list,
+               base.format('_data'), base.format('_word_log'), base.format('_trigger_log'))
+    print('Exported', base.format('_data'), base.format('_word_log'), base.format('_trigger_log'))
@@ -0,0 +1,34 @@
+# Keyboard input with device timestamps.
+# Keys come from psychopy.hardware.keyboard (the psychtoolbox backend where it is available),
+# which timestamps every press when it happens rather than when it is polled. The response
+# clock is reset by the flip that shows a question, so a key's rt is measured from the
+# question onset. wait() sleeps between polls instead of spinning on event.getKeys(), which
+# leaves the CPU to the renderer, and the poll interval does not affect the timestamps.
+
+from psychopy import core
+from psychopy.hardware import keyboard
+
+
+class KeyInput:
+    def __init__(self, poll_interval=0.002):
+        self.poll_interval = poll_interval
+        self._keyboard = keyboard.Keyboard()
+
+    def start_response_clock(self, win):
+        # rt of the next keys counts from the coming flip; keys pressed before it are dropped
+        win.callOnFlip(self._keyboard.clearEvents)
+        win.callOnFlip(self._keyboard.clock.reset)
+
+    def pressed(self, key):
+        # Non-blocking check (once per frame while a word is on screen)
+        return bool(self._keyboard.getKeys(keyList=[key]))
+
+    def wait(self, key_list, idle=None):
+        # Block until one of key_list is pressed and return (key, rt); idle() runs between polls
+        while True:
+            keys = self._keyboard.getKeys(keyList=key_list)
+            if keys:
+                return keys[0].name, keys[0].rt
+            if idle is not None:
+                idle()
+            core.wait(self.poll_interval, hogCPUperiod=0)
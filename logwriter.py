@@ -0,0 +1,114 @@
+# Background writers for the session logs.
+# append() only puts an item on an in-memory queue; a worker thread writes whatever has
+# queued up in one batch and hands it to the OS straight away, so a crash of the experiment
+# loses nothing that was appended. sync() additionally fsyncs the file and is called at safe
+# points (end of trial, pause, block break) so the data also survives a power cut.
+# If a write or fsync fails the worker keeps the error, stops writing and answers the sync
+# requests still queued; sync() and close() then raise it in the experiment thread.
+
+import os
+import queue
+import threading
+
+
+class _Sync:
+    def __init__(self):
+        self.done = threading.Event()
+
+
+_CLOSE = object()
+
+
+class BackgroundWriter:
+    # Subclasses write their own header in __init__ and implement _write_items()
+
+    def __init__(self, path, mode='w', batch_size=256):
+        self.path = path
+        self.batch_size = batch_size
+        if 'b' in mode:
+            self._file = open(path, mode)
+        else:
+            self._file = open(path, mode, newline='', encoding='utf-8')
+
+        self._queue = queue.Queue()
+        self._error = None
+        self._thread = threading.Thread(target=self._run, name=f'{type(self).__name__}({os.path.basename(path)})',
+                                        daemon=True)
+
+    def _start(self):
+        self._file.flush()
+        self._thread.start()
+
+    def append(self, item):
+        self._queue.put(item)
+
+    def sync(self, wait=True):
+        # Flush and fsync everything appended so far. With wait=False the request is queued
+        # and the caller carries on while the worker does the disk work.
+        self._raise_error()
+        request = _Sync()
+        self._queue.put(request)
+        if wait:
+            request.done.wait()
+            self._raise_error()
+
+    def close(self):
+        self._queue.put(_CLOSE)
+        self._thread.join()
+        self._raise_error()
+
+    def _raise_error(self):
+        if self._error is not None:
+            raise self._error
+
+    def _write_items(self, items):
+        raise NotImplementedError
+
+    def _run(self):
+        batch = []
+        try:
+            while True:
+                batch = [self._queue.get()]
+                while len(batch) < self.batch_size:
+                    try:
+                        batch.append(self._queue.get_nowait())
+                    except queue.Empty:
+                        break
+
+                items = []
+                for item in batch:
+                    if isinstance(item, _Sync) or item is _CLOSE:
+                        if items:
+                            self._write_items(items)
+                            items = []
+                        self._file.flush()
+                        os.fsync(self._file.fileno())
+                        if item is _CLOSE:
+                            self._file.close()
+                            return
+                        item.done.set()
+                    else:
+                        items.append(item)
+                if items:
+                    self._write_items(items)
+                self._file.flush()
+        except Exception as error:
+            self._error = error
+            self._discard(batch)
+
+    def _discard(self, batch):
+        # After a failed write: release everyone waiting on a sync until close() is requested
+        closing = False
+        for item in batch:
+            if isinstance(item, _Sync):
+                item.done.set()
+            closing = closing or item is _CLOSE
+        while not closing:
+            item = self._queue.get()
+            if isinstance(item, _Sync):
+                item.done.set()
+            closing = item is _CLOSE
+        try:
+            self._file.close()
+        except OSError:
+            pass
@@ -0,0 +1,236 @@
+# Live session monitor.
+# The experiment publishes its events to a local UDP port: EventStore.add() hands every event
+# to MonitorStream.record() as well, which packs it as a journal RECORD and appends it to a
+# bounded deque, and TimingRecorder adds a TIMING_WARNING for every late onset or dropped
+# frame. A background thread sends what has queued up every 0.1 s as datagrams of up to
+# MAX_RECORDS records, from a non-blocking socket. Nothing in the trial loop ever waits for the
+# network: without a monitor the datagrams go nowhere, when the socket buffer is full they are
+# dropped and when the thread falls behind the oldest records are dropped (each datagram has a
+# sequence number, so the monitor shows what was lost). The session info (participant, list,
+# trials, blocks) is sent every 2 s, so a monitor can be started at any time.
+#
+# In a second terminal on the experiment computer:
+#   python monitor.py
+#   python monitor.py --plain   (a status line per update instead of a redrawn screen)
+
+import argparse
+import collections
+import json
+import socket
+import struct
+import threading
+import time
+
+import journal
+from journal import ANSWERS, RECORD
+
+MONITOR_ADDRESS = ('127.0.0.1', 47800)
+PACKET = struct.Struct('<8sI')  # magic, sequence number; followed by RECORDs
+PACKET_MAGIC = b'RSVPMON1'
+MAX_RECORDS = (1400 - PACKET.size) // RECORD.size  # one unfragmented datagram
+
+# Monitor-only record type: word: index, code: trigger code, value: dropped frames, aux: onset error (s)
+TIMING_WARNING = 100
+
+
+class MonitorStream:
+    def __init__(self, address=MONITOR_ADDRESS, interval=0.1, info_every=2.0, max_pending=4096, **session):
+        self.address = address
+        self.interval = interval
+        self.info_every = info_every
+        self.info = json.dumps(session).encode('utf-8')
+        self.lost = 0  # datagrams the socket would not take
+
+        self._pending = collections.deque(maxlen=max_pending)  # thread-safe appends, oldest dropped
+        self._sequence = 0
+        self._socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self._socket.setblocking(False)
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name='MonitorStream', daemon=True)
+        self._thread.start()
+
+    def record(self, kind, t, trial=-1, word=-1, code=0, value=0, aux=0.0, wall=0.0):
+        self._pending.append(RECORD.pack(t, wall, trial, code, word, kind, value, aux))
+
+    def timing_warning(self, t, trial, word, code, dropped, onset_error):
+        self.record(TIMING_WARNING, t, trial, word, code, min(dropped, 255), onset_error)
+
+    def _send(self, data):
+        try:
+            self._socket.sendto(data, self.address)
+        except BlockingIOError:
+            self.lost += 1
+        except OSError:
+            pass  # Nothing listening, or no network: the experiment does not care
+
+    def _flush(self):
+        while self._pending:
+            records = []
+            while self._pending and len(records) < MAX_RECORDS:
+                records.append(self._pending.popleft())
+            self._sequence += 1
+            self._send(PACKET.pack(PACKET_MAGIC, self._sequence) + b''.join(records))
+
+    def _run(self):
+        last_info = -self.info_every
+        while not self._stop.wait(self.interval):
+            if time.monotonic() - last_info >= self.info_every:
+                self._send(self.info)
+                last_info = time.monotonic()
+            self._flush()
+
+    def close(self):
+        self._stop.set()
+        self._thread.join()
+        self._flush()
+        self._socket.close()
+
+
+# --- The monitor ---
+class SessionStatus:
+    def __init__(self):
+        self.info = {}
+        self.answers = []  # correct_answer per trial, if the list can be read here
+        self.reset()
+
+    def reset(self):
+        self.start = self.now = None
+        self.trial = self.word = -1
+        self.trigger = None
+        self.state = 'waiting for the session'
+        self.questions = self.answered = self.correct = 0
+        self.last_rt = None
+        self.pauses = self.breaks = 0
+        self.warnings = 0
+        self.last_warning = None
+        self.records = self.lost = 0
+        self._sequence = 0
+
+    def session_info(self, info):
+        if info.get('participant') != self.info.get('participant'):
+            self.reset()
+            try:
+                self.answers = [row.get('correct_answer', '') for row in journal.read_trial_list(info['list'])]
+            except (KeyError, OSError):
+                self.answers = []
+        self.info = info
+
+    def packet(self, data):
+        magic, sequence = PACKET.unpack_from(data)
+        if magic != PACKET_MAGIC:
+            return
+        if sequence <= self._sequence:
+            self._sequence = 0  # A new session started
+        self.lost += sequence - self._sequence - 1
+        self._sequence = sequence
+        for record in RECORD.iter_unpack(data[PACKET.size:]):
+            self.event(*record)
+
+    def event(self, t, wall, trial, code, word, kind, value, aux):
+        self.records += 1
+        self.now = t
+        if kind == journal.SESSION_START:
+            self.start, self.state = t, 'running'
+        elif kind == journal.SESSION_END:
+            self.state = 'session ended'
+        elif kind == journal.WORD:
+            self.trial, self.word, self.state = trial, word, 'running'
+        elif kind == journal.QUESTION:
+            self.trial, self.word, self.state = trial, -1, 'question'
+            self.questions += 1
+        elif kind == journal.TRIAL:
+            self.trial, self.word = trial, -1
+            if value:
+                self.answered += 1
+                self.last_rt = aux
+                correct = trial < len(self.answers) and ANSWERS.get(chr(value)) == self.answers[trial]
+                self.correct += correct
+            if self.state == 'question':
+                self.state = 'running'
+        elif kind == journal.TRIGGER:
+            self.trigger = (code, t)
+        elif kind == journal.PAUSE_START:
+            self.pauses += 1
+            self.state = 'PAUSED'
+        elif kind == journal.PAUSE_RESUME:
+            self.state = 'running'
+        elif kind == journal.BREAK_START:
+            self.breaks += 1
+            self.state = f'break after block {value}'
+        elif kind == journal.BREAK_END:
+            self.state = 'running'
+        elif kind == TIMING_WARNING:
+            self.warnings += 1
+            self.last_warning = (trial, word, value, aux)
+
+    def _block(self):
+        for block, (start, end) in enumerate(self.info.get('blocks', [])):
+            if start <= self.trial < end:
+                return f' (block {block + 1} of {len(self.info["blocks"])})'
+        return ''
+
+    def render(self, received_at):
+        lines = [f"Participant {self.info.get('participant', '?')}: {self.state}"]
+        if self.start is not None:
+            lines[0] += f' ({(self.now - self.start) / 60:.1f} min in)'
+        if self.trial >= 0:
+            word = f', word {self.word + 1}' if self.word >= 0 else ''
+            lines.append(f"Trial {self.trial + 1} of {self.info.get('trials', '?')}{self._block()}{word}")
+        if self.trigger is not None:
+            lines.append(f'Last trigger: {self.trigger[0]} ({self.now - self.trigger[1]:.1f} s ago)')
+        if self.questions:
+            line = f'Questions: {self.answered} of {self.questions} answered'
+            if self.answers and self.answered:
+                line += f', {self.correct} correct ({self.correct / self.answered:.0%})'
+            if self.last_rt is not None:
+                line += f', last response {self.last_rt:.2f} s'
+            lines.append(line)
+        lines.append(f'Pauses: {self.pauses}, breaks: {self.breaks}')
+        line = f'Timing warnings: {self.warnings}'
+        if self.last_warning:
+            trial, word, dropped, error = self.last_warning
+            line += (f' (last: trial {trial + 1} word {word + 1}, onset {error * 1000:+.1f} ms, '
+                     f'{dropped} dropped frames)')
+        lines.append(line)
+        stale = time.monotonic() - received_at
+        lines.append(f'Stream: {self.records} events, {self.lost} datagrams lost'
+                     + (f'; nothing received for {stale:.0f} s' if stale > 5 else ''))
+        return lines
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Show the live status of a running session.')
+    parser.add_argument('--host', default=MONITOR_ADDRESS[0])
+    parser.add_argument('--port', type=int, default=MONITOR_ADDRESS[1])
+    parser.add_argument('--plain', action='store_true', help='print a status line per update')
+    parser.add_argument('--refresh', type=float, default=0.25, help='seconds between redraws')
+    args = parser.parse_args()
+
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    sock.bind((args.host, args.port))
+    sock.settimeout(args.refresh)
+    status = SessionStatus()
+    received_at = last_draw = time.monotonic()
+    changed = True
+    print(f'Listening on {args.host}:{args.port}')
+    try:
+        while True:
+            try:
+                data = sock.recv(65536)
+                received_at = time.monotonic()
+                if data.startswith(b'{'):
+                    status.session_info(json.loads(data))
+                else:
+                    status.packet(data)
+                    changed = True
+            except socket.timeout:
+                pass
+            if time.monotonic() - last_draw >= args.refresh and (changed or not args.plain):
+                lines = status.render(received_at)
+                if args.plain:
+                    print(' | '.join(lines), flush=True)
+                else:
+                    print('\033[H\033[J' + '\n'.join(lines), flush=True)
+                last_draw, changed = time.monotonic(), False
+    except KeyboardInterrupt:
+        pass
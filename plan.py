@@ -0,0 +1,164 @@
+# Compiled trial plan.
+# A randomized list is turned once into plain arrays: the words of every sentence (flat, with
+# per-trial offsets), the trigger code of every word, the onset codes, which trials are
+# questions, block boundaries and the durations in frames. The trial loop only indexes into
+# these, so no tokenizing, type coercion or code arithmetic happens while it runs. The plan
+# is cached next to the list and keyed by the list's sha256 plus everything else it was
+# compiled from; loading a cached plan is a single unpickle.
+#
+# The plan also holds the session timeline: the expected number of frames from the start of
+# the session to the start of every trial (blanks, fixation and words from the frame counts,
+# plus the expected 'answer' frames for a question) and the number of questions before it.
+# Blocks are cut either every total // num_blocks trials or, with block_by='time', where the
+# timeline crosses each num_blocks-th of the expected session length. timeline.py turns the
+# index into seconds, seeks and remaining-time estimates.
+
+import os
+import pickle
+from array import array
+from bisect import bisect_left, bisect_right
+
+from psychopy import logging
+
+from checkpoint import file_hash
+from journal import read_trial_list
+
+PLAN_VERSION = 2
+
+# Trigger code schemes. With 'relative' set, onset/word/target are added to the trial's
+# condition_code; otherwise they are the codes themselves. target is used for the word at
+# the list's 1-based target_word position. sync is the clock alignment code sent between
+# trials (see clocksync.py).
+CONDITION_TRIGGERS = {'relative': True, 'onset': 0, 'word': 1, 'target': 3, 'question': 50, 'sync': 200}
+FIXED_TRIGGERS = {'relative': False, 'onset': 1, 'word': 100, 'target': 100, 'question': 254, 'sync': 200}
+
+INVALID_CONDITION_CODE = 99
+
+
+class TrialPlan:
+    def __init__(self, key, frames, triggers):
+        self.key = key
+        self.frames = dict(frames)
+        self.question_code = triggers['question']
+
+        self.ids = []
+        self.questions = []  # question text, '' for sentences
+        self.is_question = array('B')
+        self.onset_codes = array('H')
+        self.word_offsets = array('I', [0])  # words of trial i: words[word_offsets[i]:word_offsets[i + 1]]
+        self.words = []
+        self.word_codes = array('H')
+        self.blocks = []  # (first trial, end trial) per block
+        self.timeline = array('I', [0])  # expected frames before trial i: timeline[i]
+        self.question_counts = array('I', [0])  # questions before trial i
+
+    def __len__(self):
+        return len(self.ids)
+
+    def trial_words(self, trial):
+        first, last = self.word_offsets[trial], self.word_offsets[trial + 1]
+        return self.words[first:last], self.word_codes[first:last]
+
+    def block_of(self, trial):
+        return max(0, bisect_right([start for start, _ in self.blocks], trial) - 1)
+
+
+def _int(row, column, default):
+    try:
+        return int(float(row[column]))
+    except (KeyError, TypeError, ValueError):
+        logging.warning(f'Missing or invalid {column} in row: {row}')
+        return default
+
+
+def _time_blocks(plan, num_blocks):
+    # Trial boundaries nearest to each num_blocks-th of the expected length, never between a
+    # sentence and the question about it
+    total_trials, total_frames = len(plan), plan.timeline[-1]
+    bounds = [0]
+    for block in range(1, num_blocks):
+        target = total_frames * block / num_blocks
+        trial = bisect_left(plan.timeline, target, bounds[-1] + 1, total_trials)
+        if trial > bounds[-1] + 1 and target - plan.timeline[trial - 1] < plan.timeline[trial] - target:
+            trial -= 1
+        while trial < total_trials and plan.is_question[trial]:
+            trial += 1
+        bounds.append(min(trial, total_trials))
+    bounds.append(total_trials)
+    return list(zip(bounds, bounds[1:]))
+
+
+def compile_plan(trials, key, frames, triggers, num_blocks=4, block_by='trials'):
+    plan = TrialPlan(key, frames, triggers)
+    for row in trials:
+        sentence_id = row['id']
+        plan.ids.append(sentence_id)
+
+        if sentence_id.startswith('Q_'):
+            plan.is_question.append(1)
+            plan.questions.append(row['sentence'])
+            plan.onset_codes.append(0)
+            plan.word_offsets.append(len(plan.words))
+            continue
+
+        words = row['sentence'].split()
+        if triggers['relative']:
+            condition_code = _int(row, 'condition_code', INVALID_CONDITION_CODE)
+            onset_code = condition_code + triggers['onset']
+            word_code = condition_code + triggers['word']
+            target_code = condition_code + triggers['target']
+        else:
+            onset_code, word_code, target_code = triggers['onset'], triggers['word'], triggers['target']
+        target_word = _int(row, 'target_word', -1)  # 1-indexed!
+
+        plan.is_question.append(0)
+        plan.questions.append('')
+        plan.onset_codes.append(onset_code)
+        plan.words.extend(words)
+        plan.word_codes.extend(target_code if position == target_word else word_code
+                               for position in range(1, len(words) + 1))
+        plan.word_offsets.append(len(plan.words))
+
+    total_trials = len(plan)
+    trial_frames = frames.get('pre_blank', 0) + frames.get('fixation', 0) + frames.get('post_blank', 0)
+    word_frames = frames.get('word', 0) + frames.get('inter_word', 0)
+    for trial in range(total_trials):
+        if plan.is_question[trial]:
+            expected = trial_frames + frames.get('answer', 0)
+        else:
+            expected = trial_frames + word_frames * (plan.word_offsets[trial + 1] - plan.word_offsets[trial])
+        plan.timeline.append(plan.timeline[-1] + expected)
+        plan.question_counts.append(plan.question_counts[-1] + plan.is_question[trial])
+
+    if block_by == 'time':
+        plan.blocks = _time_blocks(plan, num_blocks)
+    else:
+        block_size = total_trials // num_blocks
+        for block in range(num_blocks):
+            end = total_trials if block == num_blocks - 1 else (block + 1) * block_size
+            plan.blocks.append((block * block_size, end))
+    return plan
+
+
+def load_plan(list_path, frames, triggers, num_blocks=4, list_hash=None, block_by='trials'):
+    # The cached plan for this list, frame counts and trigger scheme, compiled if there is none
+    if list_hash is None:
+        list_hash = file_hash(list_path)
+    key = (PLAN_VERSION, list_hash, sorted(frames.items()), sorted(triggers.items()), num_blocks,
+           block_by)
+    plan_path = os.path.splitext(list_path)[0] + '.plan'
+
+    try:
+        with open(plan_path, 'rb') as f:
+            plan = pickle.load(f)
+        if plan.key == key:
+            return plan
+    except Exception:
+        pass  # No plan yet, or one from an older version
+
+    plan = compile_plan(read_trial_list(list_path), key, frames, triggers, num_blocks, block_by)
+    tmp_path = plan_path + '.tmp'
+    with open(tmp_path, 'wb') as f:
+        pickle.dump(plan, f, protocol=pickle.HIGHEST_PROTOCOL)
+    os.replace(tmp_path, plan_path)
+    return plan
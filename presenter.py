@@ -0,0 +1,78 @@
+# Frame-locked RSVP presentation.
+# Durations are counted in screen refreshes at the measured frame rate and every onset is
+# the timestamp returned by win.flip(), so sleep overshoot and key polling can no longer
+# stretch a word. The onset of every frame is kept in flip_times. With a TriggerDispatcher
+# attached, armed codes are written on the flip and cleared on a later one.
+# hold() also keeps the time the next screen is due (due), counts frames dropped while
+# holding and passes every frame interval to a TimingRecorder if one is attached.
+
+from array import array
+
+from psychopy import logging
+
+DEFAULT_FRAME_RATE = 60.0
+
+
+class RSVPPresenter:
+    def __init__(self, win, frame_rate=None, triggers=None, timing=None):
+        self.win = win
+        self.triggers = triggers
+        self.timing = timing
+        if frame_rate is None:
+            frame_rate = win.getActualFrameRate(nIdentical=20, nMaxFrames=200, nWarmUpFrames=20)
+        if not frame_rate:
+            logging.warning(f'Could not measure the frame rate. Assuming {DEFAULT_FRAME_RATE} Hz.')
+            frame_rate = DEFAULT_FRAME_RATE
+
+        self.frame_rate = frame_rate
+        self.frame_duration = 1.0 / frame_rate
+        self.flip_times = array('d')
+        self.due = None  # when the screen after the last hold() is due
+        self.interrupted = False  # on_frame interrupted the last hold() (pause)
+
+    def frames(self, seconds):
+        # Nearest whole number of refreshes, at least one
+        return max(1, int(round(seconds * self.frame_rate)))
+
+    def flip(self, stim=None):
+        # Draw stim (None for a blank screen), flip and return the onset of the new frame
+        if stim is not None:
+            stim.draw()
+        if self.triggers is not None and self.triggers.pending:
+            self.win.callOnFlip(self.triggers.on_flip)
+        flip_time = self.win.flip()
+        self.flip_times.append(flip_time)
+        if self.triggers is not None:
+            self.triggers.update()
+        return flip_time
+
+    def hold(self, stim, n_frames, onset, on_frame=None):
+        # Keep stim on screen until n_frames refreshes have passed since onset. Elapsed frames
+        # are taken from the flip timestamps, so a dropped frame shortens the remaining wait
+        # instead of pushing every later onset back. on_frame may return True when it blocked
+        # (a pause); that frame is not counted as dropped. Returns the number of dropped frames.
+        elapsed = 0
+        dropped = 0
+        previous = onset
+        self.interrupted = False
+        while elapsed < n_frames - 1:
+            blocked = on_frame is not None and on_frame(elapsed)
+            flip_time = self.flip(stim)
+            frames = int(round((flip_time - onset) / self.frame_duration))
+            if blocked:
+                self.interrupted = True
+            else:
+                dropped += max(0, frames - elapsed - 1)
+                if self.timing is not None:
+                    self.timing.frame(flip_time - previous)
+            elapsed = frames
+            previous = flip_time
+        if on_frame is not None and on_frame(elapsed):
+            self.interrupted = True
+        self.due = onset + n_frames * self.frame_duration
+        return dropped
+
+    def show(self, stim, n_frames, on_frame=None):
+        onset = self.flip(stim)
+        self.hold(stim, n_frames, onset, on_frame)
+        return onset
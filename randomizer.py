@@ -1,153 +1,229 @@
+import argparse
+import hashlib
+import json
+import numpy as np
 import pandas as pd
 import random
 import os
+from concurrent.futures import ProcessPoolExecutor
 
+from checkpoint import file_hash
 
-def randomize(participant_id: str):
+
+class InfeasibleOrderError(ValueError):
+    pass
+
+
+def question_slots(n_plain, n_questions, question_interval):
+    # Sentence order of the final list: False for a plain sentence, True for the sentence of a
+    # sentence/question pair (its question follows directly). A pair goes after every
+    # question_interval rows; leftover sentences of either kind go at the end.
+    total_items = n_plain + 2 * n_questions
+    insert_positions = set(range(question_interval, total_items, question_interval + 2))
+
+    slots = []
+    row = 0
+    while n_plain or n_questions:
+        if n_questions and (row in insert_positions or not n_plain):
+            slots.append(True)
+            n_questions -= 1
+            row += 2
+        else:
+            slots.append(False)
+            n_plain -= 1
+            row += 1
+    return slots
+
+
+def _check_feasible(conditions, codes, max_repeat, min_code_distance):
+    # Counting bounds that every valid order has to meet
+    n = len(conditions)
+    for condition in set(conditions):
+        count = conditions.count(condition)
+        if count > max_repeat * (n - count + 1):
+            raise InfeasibleOrderError(
+                f'{count} sentences of condition {condition!r} cannot be spread over {n} trials '
+                f'with at most {max_repeat} in a row')
+    for code in set(codes):
+        count = codes.count(code)
+        if (count - 1) * min_code_distance + 1 > n:
+            raise InfeasibleOrderError(
+                f'{count} sentences with condition_code {code} cannot be placed {min_code_distance} '
+                f'trials apart in {n} trials')
+
+
+def solve_order(conditions, codes, is_question, slots, max_repeat=1, min_code_distance=2,
+                rng=random, max_restarts=20, stats=None):
+    # Builds the sentence order slot by slot instead of reshuffling until nothing clusters.
+    # Each slot takes a sentence of the right kind (plain or question pair) whose condition
+    # would not run longer than max_repeat, whose condition_code was last used at least
+    # min_code_distance slots earlier and that leaves the next slot something to take. Among
+    # those a condition is drawn with probability proportional to its remaining sentences,
+    # unless one has no slack left and has to go now. O(slots x conditions^2); returns the
+    # sentence index for every slot. A stats dict, if given, gets the number of restarts used.
+    n = len(slots)
+    if n != len(conditions) or sum(slots) != sum(is_question):
+        raise InfeasibleOrderError(f'{len(conditions)} sentences do not fit the {n} slots of the list')
+    _check_feasible(conditions, codes, max_repeat, min_code_distance)
+
+    code_of = dict(zip(conditions, codes))
+
+    def allowed(groups, slot, run, last_code_slot, taken=None):
+        # Conditions in groups that can go into slot; taken is a condition already used up
+        # for the slot before it (lookahead)
+        run_condition, run_length = run
+        for condition, indices in groups.items():
+            if len(indices) - (condition == taken) <= 0:
+                continue
+            if condition == run_condition and run_length >= max_repeat:
+                continue
+            if slot - last_code_slot.get(code_of[condition], -min_code_distance) < min_code_distance:
+                continue
+            yield condition
+
+    for restart in range(max_restarts):
+        pools = {True: {}, False: {}}
+        for index, (condition, question) in enumerate(zip(conditions, is_question)):
+            pools[question].setdefault(condition, []).append(index)
+        for groups in pools.values():
+            for indices in groups.values():
+                rng.shuffle(indices)
+
+        remaining = {condition: conditions.count(condition) for condition in code_of}
+        remaining_codes = {code: codes.count(code) for code in set(codes)}
+        last_code_slot = {}
+        run = (None, 0)
+
+        order = []
+        for slot, question in enumerate(slots):
+            left = n - slot
+            best, best_slack, weights = None, None, {}
+            for condition in allowed(pools[question], slot, run, last_code_slot):
+                code = code_of[condition]
+                next_run = (condition, run[1] + 1 if condition == run[0] else 1)
+                if slot + 1 < n:
+                    next_groups = pools[slots[slot + 1]]
+                    taken = condition if slots[slot + 1] == question else None
+                    if not any(allowed(next_groups, slot + 1, next_run, {**last_code_slot, code: slot}, taken)):
+                        continue
+
+                count = remaining[condition]
+                slack = min(left - (count + (count - 1) // max_repeat),
+                            left - ((remaining_codes[code] - 1) * min_code_distance + 1))
+                if best_slack is None or slack < best_slack:
+                    best, best_slack = condition, slack
+                weights[condition] = len(pools[question][condition])
+
+            if best is None:
+                break
+            if best_slack > 0:
+                best = rng.choices(list(weights), weights=list(weights.values()))[0]
+
+            order.append(pools[question][best].pop())
+            remaining[best] -= 1
+            remaining_codes[code_of[best]] -= 1
+            last_code_slot[code_of[best]] = slot
+            run = (best, run[1] + 1 if best == run[0] else 1)
+        else:
+            if stats is not None:
+                stats['restarts'] = restart
+            return order
+
+    raise InfeasibleOrderError(
+        f'No order found in {max_restarts} constructions with at most {max_repeat} sentences of a '
+        f'condition in a row and the same condition_code at least {min_code_distance} trials apart')
+
+
+def participant_seed(study_seed, participant_id):
+    # Same study seed and ID give the same seed (and list) on every machine and Python version
+    digest = hashlib.sha256(f'{study_seed}:{participant_id}'.encode('utf-8')).digest()
+    return int.from_bytes(digest[:8], 'big')
+
+
+def randomize(participant_id: str, seed=None, question_interval=26, max_repeat=1, min_code_distance=2,
+              verbose=True):
     input_file = 'stimuli.csv'
     output_dir = 'logs_order'
     if not os.path.exists(output_dir):
         os.makedirs(output_dir)
 
-    question_interval = 26
-    max_repeat = 1
-    max_attempts = 1000
+    rng = random.Random(seed)
 
     df = pd.read_csv(input_file)
     df = df.fillna('')
 
     has_question = df['question'].str.strip() != ''
-    question_pairs = df[has_question].copy()
-    plain_sentences = df[~has_question].copy()
-
-    shuffled_questions = question_pairs.sample(frac=1).reset_index(drop=True)
-
-    def has_cluster(series, max_repeat=2):
-        count = 1
-        for i in range(1, len(series)):
-            if series[i] == series[i - 1]:
-                count += 1
-                if count > max_repeat:
-                    return True
-            count = 1
-        return False
-
-    for attempt in range(max_attempts):
-        random_seed = random.randint(0, 10000)
-        shuffled_plain = plain_sentences.sample(frac=1, random_state=random_seed).reset_index(drop=True)
-        if not has_cluster(shuffled_plain['condition'].tolist(), max_repeat=max_repeat):
-            break
-    else:
-        print('Could not find a valid shuffle without condition clusters. Using last attempt.')
-
-    final_rows = []
-    question_pointer = 0
-    plain_pointer = 0
-    total_items = len(df) + len(question_pairs)
-    insert_positions = list(range(question_interval, total_items, question_interval + 2))
-
-    trial_num = 1
-    current_idx = 0
-    insert_idx = 0
-
-    while len(final_rows) < total_items:
-        should_insert_question = (
-            insert_idx < len(insert_positions)
-            and current_idx == insert_positions[insert_idx]
-        )
-
-        if should_insert_question and question_pointer < len(shuffled_questions):
-            q_row = shuffled_questions.iloc[question_pointer]
-
-            # Sentence
-            final_rows.append({
-                'trial_num': trial_num,
-                'id': q_row['id'],
-                'condition': q_row['condition'],
-                'sentence': q_row['sentence'],
-                'correct_answer': '',
-                'condition_code': q_row['condition_code'],
-                'word_count': q_row['word_count'],
-                'target_word': q_row['target_word']
-            })
-            trial_num += 1
-
-            # Question (condition_code is 50 for questions)
-            final_rows.append({
-                'trial_num': trial_num,
-                'id': f'Q_{q_row["id"]}',
-                'condition': q_row['condition'],
-                'sentence': q_row['question'],
-                'correct_answer': q_row['correct_answer'],
-                'condition_code': 50,
-                'word_count': q_row['word_count'],
-                'target_word': q_row['target_word']
-            })
-
-            question_pointer += 1
-            current_idx += 2
-            insert_idx += 1
-            continue
-
-        if plain_pointer < len(shuffled_plain):
-            f_row = shuffled_plain.iloc[plain_pointer]
-            final_rows.append({
-                'trial_num': trial_num,
-                'id': f_row['id'],
-                'condition': f_row['condition'],
-                'sentence': f_row['sentence'],
-                'correct_answer': '',
-                'condition_code': f_row['condition_code'],
-                'word_count': f_row['word_count'],
-                'target_word': f_row['target_word']
-            })
-            trial_num += 1
-            plain_pointer += 1
-            current_idx += 1
-        elif question_pointer < len(shuffled_questions):
-            q_row = shuffled_questions.iloc[question_pointer]
-
-            final_rows.append({
-                'trial_num': trial_num,
-                'id': q_row['id'],
-                'condition': q_row['condition'],
-                'sentence': q_row['sentence'],
-                'correct_answer': '',
-                'condition_code': q_row['condition_code'],
-                'word_count': q_row['word_count'],
-                'target_word': q_row['target_word']
-            })
-            trial_num += 1
-
-            final_rows.append({
-                'trial_num': trial_num,
-                'id': f'Q_{q_row["id"]}',
-                'condition': q_row['condition'],
-                'sentence': q_row['question'],
-                'correct_answer': q_row['correct_answer'],
-                'condition_code': q_row['condition_code'],
-                'word_count': q_row['word_count'],
-                'target_word': q_row['target_word']
-            })
-            trial_num += 1
-
-            question_pointer += 1
-            current_idx += 2
-        else:
-            break
+
+    # Order every sentence under the constraints
+    slots = question_slots(int((~has_question).sum()), int(has_question.sum()), question_interval)
+    order = solve_order(df['condition'].tolist(), df['condition_code'].tolist(), has_question.tolist(),
+                        slots, max_repeat=max_repeat, min_code_distance=min_code_distance, rng=rng)
+
+    # Every slot becomes one row, or two for a sentence/question pair: gather all rows in one
+    # take, then mark the question rows and fill in their columns in bulk
+    rows_per_slot = np.where(slots, 2, 1)
+    is_question_row = np.zeros(rows_per_slot.sum(), dtype=bool)
+    is_question_row[np.cumsum(rows_per_slot)[np.asarray(slots, dtype=bool)] - 1] = True
+
+    final_df = df.iloc[np.repeat(order, rows_per_slot)].reset_index(drop=True)
+    final_df['trial_num'] = np.arange(1, len(final_df) + 1)
+    final_df['id'] = np.where(is_question_row, 'Q_' + final_df['id'], final_df['id'])
+    final_df['sentence'] = np.where(is_question_row, final_df['question'], final_df['sentence'])
+    final_df['correct_answer'] = np.where(is_question_row, final_df['correct_answer'], '')
+    final_df['condition_code'] = np.where(is_question_row, 50, final_df['condition_code'])  # 50 for questions
 
     # Save to CSV
     output_path = os.path.join(output_dir, f'{participant_id}_randomized_list.csv')
-    output_df = pd.DataFrame(final_rows)[[
+    output_df = final_df[[
         'trial_num', 'id', 'condition', 'condition_code',
         'word_count', 'target_word', 'sentence', 'correct_answer'
     ]]
     output_df.to_csv(output_path, index=False, encoding='utf-8')
 
-    print('Randomized list saved.')
+    if verbose:
+        print('Randomized list saved.')
 
     return output_df
 
 
+def _randomize_participant(job):
+    participant_id, seed = job
+    randomize(participant_id, seed=seed, verbose=False)
+    path = os.path.join('logs_order', f'{participant_id}_randomized_list.csv')
+    return {'participant_id': participant_id, 'seed': seed, 'list': path, 'sha256': file_hash(path)}
+
+
+def randomize_batch(participant_ids, study_seed, workers=None, manifest_path='logs_order/manifest.json'):
+    # One list per participant, generated in parallel. The manifest records every seed and list
+    # hash, so any list can be regenerated with randomize(participant_id, seed) and checked.
+    jobs = [(participant_id, participant_seed(study_seed, participant_id)) for participant_id in participant_ids]
+    os.makedirs('logs_order', exist_ok=True)
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        lists = list(pool.map(_randomize_participant, jobs, chunksize=max(1, len(jobs) // 64)))
+
+    manifest = {'study_seed': study_seed, 'stimuli_sha256': file_hash('stimuli.csv'), 'lists': lists}
+    with open(manifest_path, 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, indent=1)
+    return manifest
+
+
 if __name__ == '__main__':
-    randomize('testing')
+    parser = argparse.ArgumentParser(description='Generate randomized lists in logs_order/.')
+    parser.add_argument('participants', nargs='*', help='participant IDs (default: a single testing list)')
+    parser.add_argument('--count', type=int, help='generate IDs {prefix}001 .. {prefix}{count}')
+    parser.add_argument('--prefix', default='P')
+    parser.add_argument('--study-seed', help='study seed the participant seeds are derived from')
+    parser.add_argument('--workers', type=int, help='worker processes (default: one per core)')
+    args = parser.parse_args()
+
+    participant_ids = list(args.participants)
+    if args.count:
+        participant_ids += [f'{args.prefix}{n:03d}' for n in range(1, args.count + 1)]
+
+    if not participant_ids:
+        randomize('testing')
+    elif args.study_seed is None:
+        parser.error('--study-seed is required for batch generation')
+    else:
+        manifest = randomize_batch(participant_ids, args.study_seed, args.workers)
+        print(f'{len(manifest["lists"])} randomized lists saved. Manifest: logs_order/manifest.json')
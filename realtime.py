@@ -0,0 +1,107 @@
+# Real-time presentation mode.
+# For the trial loop the process is protected against the two things that can stall a frame
+# from outside the experiment code:
+# - the cyclic garbage collector: objects created during startup are frozen out of it and
+#   automatic collection is turned off; collect() runs it explicitly while the blank before a
+#   trial's fixation cross and a block break are on screen, so it never runs during a sentence
+# - the OS scheduler: the process priority is raised (nice on Linux/macOS, PsychoPy's
+#   core.rush() on Windows) and, if a core is given, the process is pinned to it
+# Every protection that cannot be applied (no privileges, not supported on this system) is
+# left out and reported; nothing fails. status_line() is printed at startup, summary() (with
+# the collections that ran) is saved with the session info and exit() undoes everything.
+
+import gc
+import os
+import time
+
+
+class RealtimeMode:
+    def __init__(self, nice=-10, cpu=None):
+        self.nice = nice
+        self.cpu = cpu
+        self.status = {}
+        self.collections = 0
+        self.collect_time = 0.0
+        self.max_collect = 0.0
+        self._nice = self._affinity = None  # previous settings, restored by exit()
+
+    def enter(self):
+        gc.collect()
+        gc.freeze()
+        gc.disable()
+        self.status['gc'] = 'deferred to blanks and breaks'
+        self.status['priority'] = self._raise_priority()
+        self.status['cpu'] = self._pin() if self.cpu is not None else 'not pinned'
+        return self
+
+    def _raise_priority(self):
+        if not hasattr(os, 'setpriority'):
+            from psychopy import core
+            return 'core.rush' if core.rush(True) else 'unchanged (core.rush failed)'
+        try:
+            self._nice = os.getpriority(os.PRIO_PROCESS, 0)
+            os.setpriority(os.PRIO_PROCESS, 0, self.nice)
+            return f'nice {self.nice}'
+        except OSError as e:
+            self._nice = None
+            return f'unchanged ({e.strerror})'
+
+    def _pin(self):
+        try:
+            if hasattr(os, 'sched_setaffinity'):
+                self._affinity = os.sched_getaffinity(0)
+                os.sched_setaffinity(0, {self.cpu})
+            else:
+                import psutil  # Windows: only used if it is installed
+                self._affinity = psutil.Process().cpu_affinity()
+                psutil.Process().cpu_affinity([self.cpu])
+            return f'pinned to core {self.cpu}'
+        except ImportError:
+            return 'not pinned (needs psutil on this system)'
+        except (OSError, ValueError) as e:
+            self._affinity = None
+            return f'not pinned ({getattr(e, "strerror", None) or e})'
+
+    def collect(self):
+        # Call while nothing time-critical is on screen
+        start = time.perf_counter()
+        gc.collect()
+        duration = time.perf_counter() - start
+        self.collections += 1
+        self.collect_time += duration
+        self.max_collect = max(self.max_collect, duration)
+
+    def exit(self):
+        gc.enable()
+        gc.unfreeze()
+        if self._nice is not None:
+            try:
+                os.setpriority(os.PRIO_PROCESS, 0, self._nice)
+            except OSError:
+                pass  # Lowering it again needs no privileges, but leave it if it fails
+        elif self.status.get('priority') == 'core.rush':
+            from psychopy import core
+            core.rush(False)
+        if self._affinity is not None:
+            try:
+                if hasattr(os, 'sched_setaffinity'):
+                    os.sched_setaffinity(0, self._affinity)
+                else:
+                    import psutil
+                    psutil.Process().cpu_affinity(list(self._affinity))
+            except (ImportError, OSError, ValueError):
+                pass
+
+    def status_line(self):
+        line = (f"Realtime: gc {self.status.get('gc', 'automatic')}; priority "
+                f"{self.status.get('priority', 'unchanged')}; cpu {self.status.get('cpu', 'not pinned')}")
+        if self.collections:
+            line += (f'; {self.collections} collections (mean {self.collect_time / self.collections * 1000:.2f} ms'
+                     f' / max {self.max_collect * 1000:.2f} ms)')
+        return line
+
+    def summary(self):
+        # The protections applied and the explicit collections that ran (times in seconds)
+        mean_collect = self.collect_time / self.collections if self.collections else 0.0
+        return dict(self.status, collections=self.collections, mean_collect=mean_collect,
+                    max_collect=self.max_collect)
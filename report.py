@@ -0,0 +1,110 @@
+# Comprehension accuracy and session quality report.
+# Updates the dataset first (new or changed participants are read in parallel, see dataset.py),
+# then computes everything over the whole study at once with grouped pandas operations:
+#   question accuracy and response times per participant and per condition
+#   pauses, breaks and session length (original and post-crash sessions added up)
+#   late onsets, dropped frames and trigger delays from the timing summaries
+# and flags participants who look inattentive or whose sessions had timing problems.
+# Writes dataset/report_participants.csv and dataset/report_conditions.csv and prints the
+# participant table.
+#
+#   python report.py
+#   python report.py --min-accuracy 0.8 --max-pauses 1
+
+import argparse
+import os
+
+import pandas as pd
+
+from dataset import build_dataset, load_dataset
+from journal import ANSWERS
+
+
+def _questions(trials):
+    questions = trials[trials['is_question']]
+    return questions.assign(answered=questions['response'] != '',
+                            correct=questions['response'].map(ANSWERS) == questions['correct_answer'])
+
+
+def _accuracy(questions, by):
+    return questions.groupby(by).agg(questions=('correct', 'size'), answered=('answered', 'sum'),
+                                     accuracy=('correct', 'mean'), median_rt=('rt', 'median'))
+
+
+def condition_report(trials):
+    # Accuracy per participant and condition (the condition of the sentence a question is about)
+    return _accuracy(_questions(trials), ['participant', 'condition']).reset_index()
+
+
+def _total(values):
+    return values.sum(min_count=1)  # NaN, not 0, when no session had a timing summary
+
+
+def participant_report(trials, words, sessions, min_accuracy=0.75, max_pauses=2, max_rt=6.0,
+                       max_late_rate=0.01):
+    report = pd.DataFrame({'trials': trials.groupby('participant').size(),
+                           'words': words.groupby('participant').size()})
+    report = report.join(_accuracy(_questions(trials), 'participant'))
+    report = report.join(sessions.groupby('participant').agg(
+        sessions=('segment', 'size'),
+        duration=('duration', 'sum'),
+        pauses=('pauses', 'sum'),
+        pause_time=('pause_time', 'sum'),
+        breaks=('breaks', 'sum'),
+        break_time=('break_time', 'sum'),
+        late_onsets=('late_onsets', _total),
+        dropped_frames=('dropped_frames', _total),
+        max_trigger_delay=('max_trigger_delay', 'max'),
+        missing_triggers=('missing_triggers', _total),
+    ))
+    counts = ['trials', 'words', 'questions', 'answered']
+    report[counts] = report[counts].fillna(0).astype(int)
+    report['mean_break'] = report['break_time'] / report['breaks'].where(report['breaks'] > 0)
+
+    flags = pd.DataFrame({
+        'low accuracy': report['accuracy'] < min_accuracy,
+        'unanswered': report['answered'] < report['questions'],
+        'slow answers': report['median_rt'] > max_rt,
+        'many pauses': report['pauses'] > max_pauses,
+        'incomplete': report['trials'] < report['trials'].max(),
+        'late onsets': report['late_onsets'] > max_late_rate * report['words'],
+        'missing triggers': report['missing_triggers'] > 0,
+    }, index=report.index)
+    report['flags'] = flags.dot(flags.columns + '; ').str.removesuffix('; ')
+    return report.reset_index(names='participant')
+
+
+def _rounded(table):
+    return table.round({'accuracy': 3, 'median_rt': 3, 'duration': 1, 'pause_time': 1,
+                        'break_time': 1, 'mean_break': 1, 'max_trigger_delay': 3})
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Question accuracy and session quality over all participants.')
+    parser.add_argument('--logs', default='logs_experiment', help='folder with the session logs')
+    parser.add_argument('--lists', default='logs_order', help='folder with the randomized lists')
+    parser.add_argument('--dataset', default='dataset', help='dataset folder (updated first)')
+    parser.add_argument('--workers', type=int, default=None, help='worker processes for the update')
+    parser.add_argument('--min-accuracy', type=float, default=0.75)
+    parser.add_argument('--max-pauses', type=int, default=2)
+    parser.add_argument('--max-rt', type=float, default=6.0, help='median question response time (s)')
+    parser.add_argument('--max-late-rate', type=float, default=0.01, help='share of words with a late onset')
+    args = parser.parse_args()
+
+    build_dataset(args.logs, args.lists, args.dataset, workers=args.workers, verbose=False)
+    trials = load_dataset('trials', args.dataset)
+    words = load_dataset('words', args.dataset)
+    sessions = load_dataset('sessions', args.dataset)
+
+    participants = _rounded(participant_report(trials, words, sessions, args.min_accuracy,
+                                               args.max_pauses, args.max_rt, args.max_late_rate))
+    conditions = _rounded(condition_report(trials))
+    participants.to_csv(os.path.join(args.dataset, 'report_participants.csv'), index=False, encoding='utf-8')
+    conditions.to_csv(os.path.join(args.dataset, 'report_conditions.csv'), index=False, encoding='utf-8')
+
+    with pd.option_context('display.width', 200, 'display.max_columns', None):
+        print(participants[['participant', 'trials', 'questions', 'accuracy', 'median_rt', 'pauses',
+                            'pause_time', 'duration', 'late_onsets', 'flags']].to_string(index=False))
+    flagged = (participants['flags'] != '').sum()
+    print(f'{len(participants)} participants, {flagged} flagged. '
+          f'Tables in {args.dataset}/report_participants.csv and report_conditions.csv')
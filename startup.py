@@ -0,0 +1,24 @@
+# Startup time breakdown.
+# The experiment scripts mark the end of each startup phase (imports, window, frame rate,
+# resume check, trial plan, ...) and print report() before the first trial. Phases that wait
+# for a person (dialogs, the first SPACE press) are listed but left out of the total.
+
+import time
+
+
+class StartupTimer:
+    def __init__(self):
+        self.phases = []  # (name, seconds, waiting)
+        self._last = time.perf_counter()
+
+    def mark(self, name, waiting=False):
+        now = time.perf_counter()
+        self.phases.append((name, now - self._last, waiting))
+        self._last = now
+
+    def report(self):
+        total = sum(seconds for _, seconds, waiting in self.phases if not waiting)
+        lines = [f'Startup: {total:.3f} s (without waits)']
+        for name, seconds, waiting in self.phases:
+            lines.append(f'  {name:<22}{seconds:8.3f} s' + ('  (waiting)' if waiting else ''))
+        return '\n'.join(lines)
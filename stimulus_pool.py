@@ -0,0 +1,51 @@
+# Pre-built stimuli for the RSVP loop.
+# Every screen the trial loop shows is created once per session; word stimuli come from a
+# bounded pool whose TextStims are re-texted while the fixation cross / blank is on screen,
+# so no text layout happens between a word being drawn and its flip. With a WordTextures
+# cache the words are its pre-rendered ImageStims instead (see word_textures.py).
+
+from psychopy import visual
+
+PAUSE_TEXT = 'ΠΑΥΣΗ\nSPACE: συνέχεια, Q: έξοδος'  # PAUSE / SPACE: continue, Q: exit
+BREAK_TEXT = 'Διάλειμμα\nΠατήστε SPACE για συνέχεια.'  # Break / Press SPACE to continue
+END_TEXT = 'Το πείραμα ολοκληρώθηκε.\n\nΕυχαριστούμε!'  # The experiment is over. Thank you!
+QUESTION_PROMPT = '\n\n(Πατήστε N για Ναι, O για Όχι)'  # Press N for yes, O for no
+
+
+class StimulusPool:
+    def __init__(self, win, size=20, color='black', word_height=40, textures=None):
+        self.win = win
+        self.color = color
+        self.word_height = word_height
+        self.textures = textures
+
+        self.fixation = visual.TextStim(win, text='+', color=color, height=50)
+        self.pause = visual.TextStim(win, text=PAUSE_TEXT, color=color, height=30)
+        self.block_break = visual.TextStim(win, text=BREAK_TEXT, color=color, height=30)
+        self.end = visual.TextStim(win, text=END_TEXT, color=color, height=30)
+        self.question = visual.TextStim(win, text='', color=color, height=28, wrapWidth=800)
+
+        # Word stimuli, only without a texture cache; the pool only grows if a sentence is longer
+        # than any seen before
+        self._words = [self._new_word() for _ in range(size)] if textures is None else []
+
+    def _new_word(self):
+        return visual.TextStim(self.win, text='', color=self.color, height=self.word_height)
+
+    def prepare_words(self, words):
+        # Lay out the words of a sentence (tokenized in the compiled plan); returns the stimuli in
+        # reading order
+        if self.textures is not None:
+            return [self.textures.get(word) for word in words]
+
+        while len(self._words) < len(words):
+            self._words.append(self._new_word())
+
+        stims = self._words[:len(words)]
+        for stim, word in zip(stims, words):
+            stim.text = word
+        return stims
+
+    def prepare_question(self, question):
+        self.question.text = f'{question}{QUESTION_PROMPT}'
+        return self.question
@@ -0,0 +1,116 @@
+# Session timeline.
+# The compiled plan (plan.py) has the expected number of frames before every trial and the
+# number of questions before it. Timeline turns that index into seconds, so the expected
+# start of any trial or block, the trial at a given time and the time left from any trial
+# are a lookup or two, whatever the length of the list. Breaks and pauses are not included.
+#
+# During the session observe() is given each trial's real duration and response time: the
+# remaining-time estimate then scales the frame-timed part by the observed pace (dropped
+# frames, slow flips) and counts each question left at the mean response time so far instead
+# of the expected 'answer' frames.
+#
+# Before a session the timeline of a list gives the EEG recording length to plan for:
+#   python timeline.py logs_order/P01_randomized_list.csv
+#   python timeline.py logs_order/P01_randomized_list.csv --frame-rate 144 --break-time 90
+
+import argparse
+from bisect import bisect_right
+
+
+def minutes(seconds):
+    return f'{seconds / 60:.1f} min'
+
+
+class Timeline:
+    def __init__(self, plan, frame_duration):
+        self.plan = plan
+        self.frame_duration = frame_duration
+        self.answer_frames = plan.frames.get('answer', 0)
+        self.answer_time = self.answer_frames * frame_duration  # mean response time once there is one
+        self.pace = 1.0  # observed / expected duration of the frame-timed part of a trial
+        self._expected = self._observed = 0.0
+        self._answers = 0
+        self._answer_total = 0.0
+
+    def start_of(self, trial):
+        # Expected seconds from the session start to the start of trial (len(plan) for the end)
+        return self.plan.timeline[trial] * self.frame_duration
+
+    def block_span(self, block):
+        start, end = self.plan.blocks[block]
+        return self.start_of(start), self.start_of(end)
+
+    def duration(self):
+        return self.start_of(len(self.plan))
+
+    def trial_at(self, seconds):
+        # The trial expected to be running the given number of seconds into the session
+        trial = bisect_right(self.plan.timeline, seconds / self.frame_duration) - 1
+        return min(len(self.plan) - 1, max(0, trial))
+
+    def _split(self, start, end):
+        # (frame-timed frames, questions) of trials start to end
+        questions = self.plan.question_counts[end] - self.plan.question_counts[start]
+        frames = self.plan.timeline[end] - self.plan.timeline[start] - questions * self.answer_frames
+        return frames, questions
+
+    def observe(self, trial, duration, rt=0.0):
+        # duration: from the trial's first blank to its end; rt: the answer time of a question
+        frames, questions = self._split(trial, trial + 1)
+        expected = frames * self.frame_duration
+        observed = duration - rt
+        if observed > 2 * expected + 1.0:
+            return  # Paused during the trial: says nothing about the pace
+        self._expected += expected
+        self._observed += observed
+        self.pace = self._observed / self._expected
+        if questions and rt > 0:
+            self._answers += 1
+            self._answer_total += rt
+            self.answer_time = self._answer_total / self._answers
+
+    def remaining(self, trial, end=None):
+        # Estimated seconds from the start of trial to the end of the session (or of trial end)
+        frames, questions = self._split(trial, len(self.plan) if end is None else end)
+        return frames * self.frame_duration * self.pace + questions * self.answer_time
+
+    def report(self, trial=0):
+        spans = (self.block_span(block) for block in range(len(self.plan.blocks)))
+        blocks = ' / '.join(f'{(end - start) / 60:.1f}' for start, end in spans)
+        line = (f'Timeline: {len(self.plan)} trials in {len(self.plan.blocks)} blocks of {blocks} min; '
+                f'{minutes(self.duration())} without breaks')
+        if trial:
+            line += f'; {minutes(self.remaining(trial))} left from trial {trial + 1}'
+        return line
+
+
+if __name__ == '__main__':
+    from calibration import SCHEDULE
+    from journal import read_trial_list
+    from plan import FIXED_TRIGGERS, compile_plan
+
+    parser = argparse.ArgumentParser(description='Expected session length and block timing of a randomized list.')
+    parser.add_argument('list', help='randomized list CSV')
+    parser.add_argument('--frame-rate', type=float, default=60.0)
+    parser.add_argument('--blocks', type=int, default=4)
+    parser.add_argument('--block-by', choices=['trials', 'time'], default='trials',
+                        help="'time' for the blocks of equal expected length that BLOCK_BY = 'time' gives")
+    parser.add_argument('--answer-time', type=float, default=SCHEDULE['answer'],
+                        help='expected question response time (s)')
+    parser.add_argument('--break-time', type=float, default=60.0, help='expected length of a block break (s)')
+    args = parser.parse_args()
+
+    # The durations of the experiment scripts
+    seconds = dict(SCHEDULE, answer=args.answer_time)
+    frames = {name: max(1, int(round(value * args.frame_rate))) for name, value in seconds.items()}
+    plan = compile_plan(read_trial_list(args.list), None, frames, FIXED_TRIGGERS, args.blocks, args.block_by)
+    timeline = Timeline(plan, 1 / args.frame_rate)
+
+    for block, (start, end) in enumerate(plan.blocks):
+        block_start, block_end = timeline.block_span(block)
+        questions = plan.question_counts[end] - plan.question_counts[start]
+        print(f'Block {block + 1}: trials {start + 1}-{end} ({questions} questions), '
+              f'{minutes(block_start)} to {minutes(block_end)} ({minutes(block_end - block_start)})')
+    breaks = (len(plan.blocks) - 1) * args.break_time
+    print(f'{minutes(timeline.duration())} of trials + {minutes(breaks)} of breaks = '
+          f'{minutes(timeline.duration() + breaks)} of recording')
@@ -0,0 +1,148 @@
+# Presentation timing records.
+# For every word the trial loop records when it was due, when its flip actually happened, when
+# the next screen replaced it, the frames dropped while it was held and how long after the
+# flip its trigger was written. The presenter adds every frame interval of its hold() loops,
+# tagged with the trial running between trial_started() and trial_ended().
+# At the end of a session the records are written next to the word log:
+#   {id}_timing.csv          one row per word (times in ms)
+#   {id}_timing_summary.csv  one row per trial, per block and for the session
+#   {id}_flip_times.bin      every flip timestamp of the session (float64, native byte order)
+# An onset counts as late when it missed its frame by more than half a refresh. Late onsets
+# and dropped frames also go to the live session monitor when one is set (see monitor.py).
+
+import csv
+import math
+from array import array
+from statistics import fmean, pstdev
+
+WORD_TIMING_FIELDNAMES = ['trial_num', 'word', 'code', 'onset', 'onset_error', 'duration',
+                          'duration_error', 'dropped_frames', 'trigger_delay', 'paused']
+SUMMARY_FIELDNAMES = ['level', 'trial_num', 'block', 'words', 'late_onsets', 'max_onset_error',
+                      'mean_duration_error', 'max_duration_error', 'dropped_frames',
+                      'max_trigger_delay', 'missing_triggers', 'paused_words',
+                      'mean_frame_interval', 'sd_frame_interval', 'max_frame_interval']
+
+
+class TimingRecorder:
+    def __init__(self, frame_duration, word_frames, triggers=None):
+        self.frame_duration = frame_duration
+        self.word_duration = word_frames * frame_duration
+        self.triggers = triggers
+        self.monitor = None  # MonitorStream
+
+        self.trial = array('i')
+        self.word = array('h')
+        self.code = array('H')
+        self.due = array('d')
+        self.onset = array('d')
+        self.offset = array('d')
+        self.trigger_time = array('d')  # nan if no trigger went out on the onset flip
+        self.dropped = array('H')
+        self.paused = array('B')
+        self.intervals = array('f')  # every frame interval measured in hold()
+        self.interval_trial = array('i')  # the trial of each interval, -1 between trials
+        self._current_trial = -1
+
+    def trial_started(self, trial):
+        self._current_trial = trial
+
+    def trial_ended(self):
+        self._current_trial = -1
+
+    def frame(self, interval):
+        self.intervals.append(interval)
+        self.interval_trial.append(self._current_trial)
+
+    def word_shown(self, trial, word, code, due, onset, offset, dropped, paused=False):
+        trigger_time = math.nan
+        if self.triggers is not None and self.triggers.sent:
+            sent_code, written_at = self.triggers.sent[-1]
+            if sent_code == code and onset <= written_at < offset:
+                trigger_time = written_at
+
+        self.trial.append(trial)
+        self.word.append(word)
+        self.code.append(code)
+        self.due.append(onset if due is None else due)
+        self.onset.append(onset)
+        self.offset.append(offset)
+        self.trigger_time.append(trigger_time)
+        self.dropped.append(dropped)
+        self.paused.append(paused)
+        if self.monitor is not None and (dropped or onset - self.due[-1] > self.frame_duration / 2):
+            self.monitor.timing_warning(onset, trial, word, code, dropped, onset - self.due[-1])
+
+    def word_rows(self, start):
+        for i in range(len(self.trial)):
+            duration = self.offset[i] - self.onset[i]
+            yield {
+                'trial_num': self.trial[i] + 1,
+                'word': self.word[i] + 1,
+                'code': self.code[i],
+                'onset': _ms(self.onset[i] - start),
+                'onset_error': _ms(self.onset[i] - self.due[i]),
+                'duration': _ms(duration),
+                'duration_error': _ms(duration - self.word_duration),
+                'dropped_frames': self.dropped[i],
+                'trigger_delay': _ms(self.trigger_time[i] - self.onset[i]),
+                'paused': self.paused[i],
+            }
+
+    def _summary(self, indices, intervals):
+        late = self.frame_duration / 2
+        onset_errors = [self.onset[i] - self.due[i] for i in indices]
+        duration_errors = [self.offset[i] - self.onset[i] - self.word_duration
+                           for i in indices if not self.paused[i]]
+        trigger_delays = [self.trigger_time[i] - self.onset[i] for i in indices
+                          if not math.isnan(self.trigger_time[i])]
+        return {
+            'words': len(indices),
+            'late_onsets': sum(error > late for error in onset_errors),
+            'max_onset_error': _ms(max(onset_errors, default=0.0)),
+            'mean_duration_error': _ms(fmean(duration_errors) if duration_errors else 0.0),
+            'max_duration_error': _ms(max(duration_errors, key=abs, default=0.0)),
+            'dropped_frames': sum(self.dropped[i] for i in indices),
+            'max_trigger_delay': _ms(max(trigger_delays, default=math.nan)),
+            'missing_triggers': len(indices) - len(trigger_delays),
+            'paused_words': sum(self.paused[i] for i in indices),
+            'mean_frame_interval': _ms(fmean(intervals)) if intervals else '',
+            'sd_frame_interval': _ms(pstdev(intervals)) if intervals else '',
+            'max_frame_interval': _ms(max(intervals)) if intervals else '',
+        }
+
+    def summary_rows(self, block_of):
+        by_trial, by_block = {}, {}
+        for i, trial in enumerate(self.trial):
+            by_trial.setdefault(trial, []).append(i)
+            by_block.setdefault(block_of(trial), []).append(i)
+        trial_intervals, block_intervals = {}, {}
+        for interval, trial in zip(self.intervals, self.interval_trial):
+            if trial >= 0:
+                trial_intervals.setdefault(trial, []).append(interval)
+                block_intervals.setdefault(block_of(trial), []).append(interval)
+
+        for trial, indices in by_trial.items():
+            yield dict(self._summary(indices, trial_intervals.get(trial, [])), level='trial',
+                       trial_num=trial + 1, block=block_of(trial) + 1)
+        for block, indices in by_block.items():
+            yield dict(self._summary(indices, block_intervals.get(block, [])), level='block', block=block + 1)
+        yield dict(self._summary(range(len(self.trial)), self.intervals), level='session')
+
+
+def _ms(seconds):
+    return '' if math.isnan(seconds) else round(seconds * 1000, 3) + 0.0  # no -0.0
+
+
+def write_timing_logs(timing, flip_times, start, block_of, timing_path, summary_path, flips_path):
+    with open(timing_path, 'w', newline='', encoding='utf-8') as f:
+        writer = csv.DictWriter(f, fieldnames=WORD_TIMING_FIELDNAMES)
+        writer.writeheader()
+        writer.writerows(timing.word_rows(start))
+
+    with open(summary_path, 'w', newline='', encoding='utf-8') as f:
+        writer = csv.DictWriter(f, fieldnames=SUMMARY_FIELDNAMES, restval='')
+        writer.writeheader()
+        writer.writerows(timing.summary_rows(block_of))
+
+    with open(flips_path, 'wb') as f:
+        flip_times.tofile(f)
@@ -0,0 +1,130 @@
+# Trigger output backends.
+# Every backend has write(code), close() and a description for the logs. The station's backend
+# comes from trigger_config.json in the working directory if there is one, e.g.
+#   {"backend": "parallel", "address": "0x3FE8"}
+#   {"backend": "serial", "port": "COM3", "baudrate": 115200}      (USB/serial TTL boxes)
+#   {"backend": "socket", "host": "127.0.0.1", "port": 5005}       (one UDP byte per code)
+#   {"backend": "loopback"}                                        (records codes, no hardware)
+# and from the script's default otherwise.
+#
+# calibrate() times a series of writes of 0, so no marker reaches the recording, and returns
+# the mean, sd and maximum write latency. The figures are saved in {id}_session_info.json so
+# trigger times can be corrected in analysis. They cover the time the write takes on this computer
+# (driver and bus), not any delay inside the amplifier.
+
+import json
+import os
+import socket
+import time
+from statistics import fmean, pstdev
+
+from psychopy import logging
+
+CONFIG_FILE = 'trigger_config.json'
+
+
+class ParallelPort:
+    def __init__(self, address=0x3FE8):
+        from psychopy import parallel  # Needs the port driver, so only imported when used
+        if isinstance(address, str):
+            address = int(address, 0)
+        parallel.setPortAddress(address)
+        self._set_data = parallel.setData
+        self.description = f'parallel {address:#06x}'
+
+    def write(self, code):
+        self._set_data(code)
+
+    def close(self):
+        self._set_data(0)
+
+
+class SerialPort:
+    def __init__(self, port, baudrate=115200):
+        import serial  # pyserial, only needed for serial trigger boxes
+        self._serial = serial.Serial(port, baudrate=baudrate, timeout=0, write_timeout=0.1)
+        self.description = f'serial {port} {baudrate} baud'
+
+    def write(self, code):
+        # One byte per code; flush() returns once it has left the OS buffer
+        self._serial.write(bytes((code,)))
+        self._serial.flush()
+
+    def close(self):
+        self.write(0)
+        self._serial.close()
+
+
+class SocketPort:
+    def __init__(self, host='127.0.0.1', port=5005):
+        # Not connected, so a receiver that is not listening cannot make a write fail mid-trial
+        self._socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self._address = (host, port)
+        self.description = f'socket udp://{host}:{port}'
+
+    def write(self, code):
+        self._socket.sendto(bytes((code,)), self._address)
+
+    def close(self):
+        self._socket.close()
+
+
+class LoopbackPort:
+    # Keeps every write with its time; with log set, also notes it in the PsychoPy log
+    def __init__(self, clock=time.perf_counter, log=False):
+        self._clock = clock
+        self.log = log
+        self.writes = []  # (code, time)
+        self.description = 'loopback'
+
+    def write(self, code):
+        self.writes.append((code, self._clock()))
+        if self.log and code:
+            logging.exp(f'[Mock trigger] Code {code} would have been sent.')
+
+    def close(self):
+        pass
+
+
+BACKENDS = {
+    'parallel': ParallelPort,
+    'serial': SerialPort,
+    'socket': SocketPort,
+    'loopback': LoopbackPort,
+}
+
+
+def load_config(default, path=CONFIG_FILE):
+    if not os.path.exists(path):
+        return dict(default)
+    with open(path, encoding='utf-8') as f:
+        return json.load(f)
+
+
+def open_port(config):
+    options = dict(config)
+    backend = options.pop('backend')
+    if backend not in BACKENDS:
+        raise ValueError(f'Unknown trigger backend {backend!r} (expected one of {", ".join(BACKENDS)})')
+    return BACKENDS[backend](**options)
+
+
+def calibrate(port, writes=200, clock=time.perf_counter):
+    latencies = []
+    for _ in range(writes):
+        before = clock()
+        port.write(0)
+        latencies.append(clock() - before)
+    return {
+        'backend': port.description,
+        'writes': writes,
+        'mean': fmean(latencies),
+        'sd': pstdev(latencies),
+        'max': max(latencies),
+    }
+
+
+def latency_line(calibration):
+    return (f"Trigger backend: {calibration['backend']}; write latency "
+            f"mean {calibration['mean'] * 1000:.3f} ms / sd {calibration['sd'] * 1000:.3f} ms / "
+            f"max {calibration['max'] * 1000:.3f} ms over {calibration['writes']} writes")
@@ -0,0 +1,64 @@
+# Flip-locked trigger output.
+# Codes are armed before a flip and written to the port by a win.callOnFlip() callback, so the
+# EEG marker lands on the visual onset instead of 5-10 ms before it. The line is cleared from
+# update() once the pulse width has passed (the presenter calls it after every flip), so
+# nothing waits on the port while frames are being drawn. Codes armed back to back are queued
+# and go out on later flips, at least min_gap after the line was cleared, so they cannot merge.
+# If log is set it is called with (code, time) for every code written. busy_frames() is how
+# many refreshes before a flip a code must go out for the next one to go out on that flip.
+
+import math
+from collections import deque
+
+
+class TriggerDispatcher:
+    def __init__(self, write, clock, pulse_width=0.005, min_gap=0.005, log=None):
+        self._write = write
+        self._clock = clock
+        self.pulse_width = pulse_width
+        self.min_gap = min_gap
+        self.log = log
+
+        self._queue = deque()
+        self._high = False
+        self._changed_at = float('-inf')
+        self.sent = []  # (code, time the code was written)
+
+    @property
+    def pending(self):
+        return bool(self._queue)
+
+    def busy_frames(self, frame_duration):
+        # Refreshes from writing a code until the next can be written: the pulse, then min_gap
+        return math.ceil(self.pulse_width / frame_duration) + math.ceil(self.min_gap / frame_duration)
+
+    def arm(self, code):
+        self._queue.append(code)
+
+    def on_flip(self):
+        if self._high or not self._queue:
+            return
+        if self._clock() - self._changed_at < self.min_gap:
+            return
+
+        code = self._queue.popleft()
+        self._write(code)
+        self._high = True
+        self._changed_at = self._clock()
+        self.sent.append((code, self._changed_at))
+        if self.log is not None:
+            self.log(code, self._changed_at)
+
+    def update(self):
+        if self._high and self._clock() - self._changed_at >= self.pulse_width:
+            self._write(0)
+            self._high = False
+            self._changed_at = self._clock()
+
+    def release(self):
+        # Clear the line regardless of pulse width (end of session)
+        self._queue.clear()
+        if self._high:
+            self._write(0)
+            self._high = False
+            self._changed_at = self._clock()
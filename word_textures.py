@@ -0,0 +1,114 @@
+# Pre-rendered word textures.
+# Every unique word is rendered once with the same TextStim settings the words are shown with,
+# read back from the window's back buffer (so glyphs and Greek diacritics look exactly as
+# before) and saved as a PNG under word_textures/<style>/, where style covers the PsychoPy
+# version, font, height and colours. At startup the words of the trial plan are loaded into
+# ImageStims kept in an LRU bounded by texture memory, so showing a word is a single textured
+# quad whatever its length, with no text layout in the trial loop. A word evicted from the LRU
+# is loaded from disk again, one that was never seen is rendered (the back buffer is cleared
+# afterwards).
+#
+# The cache can be filled ahead of time for every word in stimuli.csv:
+#   python word_textures.py
+
+import hashlib
+import json
+import os
+from collections import OrderedDict
+
+import psychopy
+from PIL import Image
+from PIL.PngImagePlugin import PngInfo
+from psychopy import visual
+
+CACHE_DIR = 'word_textures'
+
+
+class WordTextures:
+    def __init__(self, win, height=40, color='black', font=None, cache_dir=CACHE_DIR,
+                 max_bytes=128 * 2 ** 20):
+        self.win = win
+        self.height = height
+        self.max_bytes = max_bytes
+
+        style = json.dumps([getattr(psychopy, '__version__', ''), font, height, str(color),
+                            str(getattr(win, 'color', ''))])
+        self.path = os.path.join(cache_dir, hashlib.sha1(style.encode()).hexdigest()[:12])
+        os.makedirs(self.path, exist_ok=True)
+
+        options = {'font': font} if font else {}
+        self._text = visual.TextStim(win, text='', color=color, height=height, **options)
+        self._stims = OrderedDict()  # word -> ImageStim, least recently used first
+        self._bytes = 0
+        self.rendered = self.loaded = 0
+
+    def _file(self, word):
+        return os.path.join(self.path, hashlib.sha1(word.encode('utf-8')).hexdigest()[:20] + '.png')
+
+    def _render(self, word, path):
+        # Draw the word on the back buffer, crop it out of the frame and clear the buffer
+        self._text.text = word
+        self._text.draw()
+        frame = self.win.getMovieFrame(buffer='back')
+        self.win.movieFrames.pop()
+        self.win.clearBuffer()
+
+        scale = frame.size[0] / self.win.size[0]
+        text_width = self._text.boundingBox[0]
+        width = int((text_width + self.height) * scale) // 2 * 2
+        height = int(self.height * 1.5 * scale) // 2 * 2  # room for accents and descenders
+        left, top = (frame.size[0] - width) // 2, (frame.size[1] - height) // 2
+        image = frame.crop((left, top, left + width, top + height))
+        size = (width / scale, height / scale)  # in pix units (differs on high-DPI displays)
+
+        info = PngInfo()
+        info.add_text('size', f'{size[0]},{size[1]}')
+        tmp_path = path + '.tmp'
+        image.save(tmp_path, format='PNG', pnginfo=info)
+        os.replace(tmp_path, path)
+        self.rendered += 1
+        return image, size
+
+    def get(self, word):
+        stim = self._stims.get(word)
+        if stim is not None:
+            self._stims.move_to_end(word)
+            return stim
+
+        path = self._file(word)
+        if os.path.exists(path):
+            with Image.open(path) as image:
+                image.load()
+            size = tuple(float(value) for value in image.text['size'].split(','))
+            self.loaded += 1
+        else:
+            image, size = self._render(word, path)
+
+        stim = visual.ImageStim(self.win, image=image, units='pix', interpolate=False, size=size)
+        stim.nbytes = image.size[0] * image.size[1] * 4
+        self._stims[word] = stim
+        self._bytes += stim.nbytes
+        while self._bytes > self.max_bytes and len(self._stims) > 1:
+            _, evicted = self._stims.popitem(last=False)
+            self._bytes -= evicted.nbytes
+        return stim
+
+    def preload(self, words):
+        # Unique words in order; with more than max_bytes of them the first ones are evicted again
+        for word in dict.fromkeys(words):
+            self.get(word)
+
+    def report(self):
+        return (f'Word textures: {len(self._stims)} in memory ({self._bytes / 2 ** 20:.1f} MB), '
+                f'{self.loaded} loaded from {self.path}, {self.rendered} rendered')
+
+
+if __name__ == '__main__':
+    from journal import read_trial_list
+
+    win = visual.Window(fullscr=False, color='white', units='pix')
+    textures = WordTextures(win, max_bytes=0)
+    for row in read_trial_list('stimuli.csv'):
+        textures.preload(row['sentence'].split())
+    print(textures.report())
+    win.close()